@@ -0,0 +1,99 @@
+"""
+Замер стоимости создания экземпляров и первого обращения к полям классов, декорированных _record
+
+Запуск из корня проекта:
+    python -m Tests._record_bench
+"""
+import dataclasses
+import inspect
+import time
+import timeit
+
+from _record import record, record_from
+
+
+def legacy_setattr(self, key, value):
+    """
+    Прежняя реализация __setattr__: разбор аннотаций и вызов конструктора типа при каждом присвоении
+    """
+    if attr_type := self.__annotations__.get(key, None):
+        if type(attr_type) == str:
+            attr_type = globals()[attr_type]
+        if isinstance(attr_type, dataclasses.InitVar):
+            attr_type = attr_type.type
+        value = attr_type(value)
+        object.__setattr__(self, key, value)
+    else:
+        raise ValueError(f"attribute {key} not found")
+
+
+@record_from
+class Item:
+    name: str
+    size: int
+    ratio: float
+    public: bool
+    tags: list
+
+
+class LegacyItem:
+    __annotations__ = dict(Item.__annotations__)
+    __setattr__ = legacy_setattr
+
+
+LegacyItem = dataclasses.dataclass(LegacyItem)
+
+
+def bench_construct(count: int = 1_000_000):
+    print(f"{count} экземпляров, с")
+    tags = ["a"]
+    for label, item_cls in (("legacy", LegacyItem), ("plan", Item)):
+        start = time.perf_counter()
+        for i in range(count):
+            item_cls("file", i, 0.5, True, tags)
+        print(f"{label:<8} {time.perf_counter() - start:8.2f}")
+    # Значения, требующие приведения типа
+    start = time.perf_counter()
+    for i in range(count):
+        Item(b"file".decode(), str(i), 1, 0, ("a",))
+    print(f"{'convert':<8} {time.perf_counter() - start:8.2f}")
+
+
+class Volume:
+    def __init__(self, owner, name):
+        self.owner, self.name = owner, name
+
+
+@record
+class Owner:
+    volume: Volume
+
+
+def legacy_getattr(self, name):
+    """
+    Прежняя реализация создания значения поля: разбор сигнатуры конструктора при каждом обращении
+    """
+    attr_type = Owner.__annotations__[name]
+    params = [self, name]
+    value = attr_type(*(params[: len(inspect.signature(attr_type).parameters)]))
+    object.__setattr__(self, name, value)
+    return value
+
+
+class LegacyOwner(Owner):
+    __getattr__ = legacy_getattr
+
+
+def bench_first_access(number: int = 100_000):
+    """
+    Создание экземпляра класса, декорированного _record.record, и первое обращение к полю без значения
+    """
+    print("создание экземпляра и первое обращение к полю, мкс")
+    for label, cls in (("signature", LegacyOwner), ("cached", Owner)):
+        seconds = timeit.timeit(lambda: cls().volume, number=number)
+        print(f"{label:<10} {seconds / number * 1e6:8.2f}")
+
+
+if __name__ == "__main__":
+    bench_construct()
+    bench_first_access()
@@ -0,0 +1,73 @@
+import copy
+import threading
+import time
+from dataclasses import field, MISSING
+from datetime import datetime
+
+import _record
+from _record import _CoercionPlan, record
+
+
+class Volume:
+    def __init__(self, owner, name):
+        self.owner, self.name = owner, name
+
+
+@record
+class Disk:
+    speed: int
+    volume: Volume
+    label: "Label"
+    tags: list = field(default_factory=list)
+    when: datetime
+
+
+class Label(str):
+    ...
+
+
+def test_lazy_fields():
+    disk = Disk()
+    assert "volume" not in vars(disk)
+    # Поле создается при первом обращении: конструктор типа вызывается с (объект, имя поля)
+    volume = disk.volume
+    assert (volume.owner, volume.name) == (disk, "volume")
+    assert disk.volume is volume
+    # Конструктор встроенного типа - без параметров
+    assert disk.speed == 0 and type(disk.label) is Label
+    assert disk.tags == []
+    assert not hasattr(disk, "size")
+    # Тип, который не создается без параметров, дает поле без значения, а не ошибку
+    assert disk.when is MISSING and hasattr(disk, "when")
+    assert "when=" in repr(disk) and copy.copy(disk).speed == 0
+
+
+def test_lazy_fields_none():
+    class Event:
+        when: datetime
+
+    assert record(Event, MISSING_is_None=True)().when is None
+
+
+def test_coercion_plan_threads(monkeypatch):
+    class Point:
+        x: int
+        y: int
+
+    started = threading.Event()
+
+    class SlowAnnotations(dict):
+        def items(self):
+            for item in super().items():
+                started.set()
+                time.sleep(0.05)
+                yield item
+
+    monkeypatch.setattr(_record, "resolve_annotations", lambda cls: SlowAnnotations(x=int, y=int))
+    plan = _CoercionPlan(Point)
+    thread = threading.Thread(target=plan.__getitem__, args=("x",))
+    thread.start()
+    # План еще заполняется другим потоком: обращение к полю не должно давать ошибку
+    started.wait()
+    assert plan["y"] == (int, int)
+    thread.join()
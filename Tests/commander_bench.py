@@ -0,0 +1,80 @@
+"""
+Замеры расхода памяти и скорости структур данных commander
+
+Запуск из корня проекта:
+    python -m Tests.commander_bench [количество_элементов]
+"""
+import dataclasses
+import sys
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from commander import FileInfo, RecordTable
+
+
+@dataclasses.dataclass
+class DictResource:
+    is_folder: bool
+    path: str
+    name: str
+    full_name: str
+    created: datetime
+    modified: datetime
+
+    def __hash__(self):
+        return hash(self.full_name)
+
+
+@dataclasses.dataclass
+class DictFileInfo(DictResource):
+    size: int
+    md5: str
+    sha256: str
+
+    def __hash__(self):
+        return hash((self.md5, self.sha256, self.size))
+
+
+_START = datetime(2023, 1, 31, tzinfo=timezone.utc)
+
+
+def make_files(cls: type, count: int) -> list:
+    return [
+        cls(
+            is_folder=False,
+            path=f"/folder_{num // 1000}",
+            name=f"file_{num}.jpg",
+            full_name=f"/folder_{num // 1000}/file_{num}.jpg",
+            created=_START,
+            modified=_START + timedelta(seconds=num),
+            size=num,
+            md5=f"{num:032x}",
+            sha256=f"{num:064x}",
+        )
+        for num in range(count)
+    ]
+
+
+def measure(fn) -> tuple[int, object]:
+    tracemalloc.start()
+    try:
+        result = fn()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+
+def bench_memory(count: int):
+    print(f"Память листинга из {count} файлов, байт на элемент")
+    for title, cls in (("dataclass (без slots)", DictFileInfo), ("dataclass(slots=True)", FileInfo)):
+        size, files = measure(lambda: make_files(cls, count))
+        print(f"{title:<40} {size / count:8.1f}")
+        del files
+    files = make_files(FileInfo, count)
+    size, table = measure(lambda: RecordTable(files))
+    print(f"{'RecordTable':<40} {size / count:8.1f}")
+
+
+if __name__ == "__main__":
+    bench_memory(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
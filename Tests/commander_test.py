@@ -0,0 +1,738 @@
+import dataclasses
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from commander import (
+    BaseFS,
+    FileInfo,
+    FSLayer,
+    FSLayersPool,
+    HashIndex,
+    HashOfFile,
+    LocalFS,
+    LayerStats,
+    merge_chains,
+    Node,
+    rank_sources,
+    SourceChoice,
+    RecordTable,
+    UnionFS,
+)
+from hashing import HashCache
+from sync_plan import Journal, Plan
+
+
+def file_info(
+    full_name: str, size: int = 1, md5: str = "ab" * 16, modified: datetime = None
+) -> FileInfo:
+    modified = modified or datetime(2023, 1, 31, 17, 17, 57, tzinfo=timezone.utc)
+    path, _, name = full_name.rpartition("/")
+    return FileInfo(
+        is_folder=False,
+        path=path,
+        name=name,
+        full_name=full_name,
+        created=modified,
+        modified=modified,
+        size=size,
+        md5=md5,
+        sha256="cd" * 32,
+    )
+
+
+class MemoryWriter(io.BytesIO):
+    def __init__(self, fs: "MemoryFS", path: str, data: bytes):
+        super().__init__(data)
+        self.seek(len(data))
+        self.fs, self.path = fs, path
+
+    def close(self):
+        if not self.closed:
+            self.fs.put_data(self.path, self.getvalue())
+        super().close()
+
+
+class MemoryFS(BaseFS):
+    """
+    Файловая система в памяти, считает обращения к ls
+    """
+
+    def __init__(self, *files: FileInfo):
+        self.files = {file.full_name: file for file in files}
+        self.data: dict[str, bytes] = {}
+        self.ls_calls = 0
+
+    def put_data(self, full_name: str, data: bytes, modified: datetime = None):
+        self.data[full_name] = data
+        self.files[full_name] = dataclasses.replace(
+            file_info(full_name, len(data), hashlib.md5(data).hexdigest(), modified),
+            sha256=hashlib.sha256(data).hexdigest(),
+        )
+
+    def open_read(self, path: str, offset: int = 0):
+        if path not in self.data:
+            raise FileNotFoundError(path)
+        return io.BytesIO(self.data[path][offset:])
+
+    def open_write(self, path: str, offset: int = 0):
+        return MemoryWriter(self, path, self.data.get(path, b"")[:offset])
+
+    def set_modified(self, path: str, modified: datetime):
+        self.files[path] = dataclasses.replace(self.files[path], modified=modified)
+
+    def touch(self, path_to_file: str):
+        self.files[path_to_file] = file_info(path_to_file, 0)
+
+    def mkdir(self, path_to_folder: str):
+        ...
+
+    def rm(self, path: str):
+        for full_name in list(self.files):
+            if full_name == path or full_name.startswith(path + "/"):
+                del self.files[full_name]
+                self.data.pop(full_name, None)
+
+    def cp(self, path: str, target: str, overwrite: bool = False):
+        self.files[target] = dataclasses.replace(
+            self.files[path], full_name=target, name=target.rpartition("/")[2]
+        )
+        if path in self.data:
+            self.data[target] = self.data[path]
+
+    def mv(self, path: str, target: str, overwrite: bool = False):
+        self.cp(path, target, overwrite)
+        self.rm(path)
+
+    def ls(self, path_to_folder: str = None):
+        self.ls_calls += 1
+        return list(self.files.values())
+
+    def get(self, path: str):
+        return self.files.get(path)
+
+
+class FeedFS(MemoryFS):
+    """
+    Облако в памяти с лентой изменений
+    """
+
+    def __init__(self, *files: FileInfo):
+        super().__init__(*files)
+        self.log: list[str] = []
+
+    def put(self, file: FileInfo):
+        self.files[file.full_name] = file
+        self.log.append(file.full_name)
+
+    def revision(self) -> str:
+        return str(len(self.log))
+
+    def changes_since(self, revision: str):
+        names = self.log[int(revision) :]
+        return (
+            self.revision(),
+            [self.files[name] for name in names if name in self.files],
+            [name for name in names if name not in self.files],
+        )
+
+
+class Killed(BaseException):
+    "Аварийное завершение исполнителя"
+
+
+class KillingWriter:
+    def __init__(self, file, fs: "KillingFS"):
+        self.file, self.fs = file, fs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.file.close()
+
+    def write(self, data: bytes):
+        self.fs.countdown -= 1
+        if self.fs.countdown == 0:
+            # Блок записан не полностью
+            self.fs.written += self.file.write(data[: len(data) // 2])
+            raise Killed
+        self.fs.written += self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+@dataclasses.dataclass
+class KillingFS(LocalFS):
+    """
+    Удаленное хранилище на локальном диске: исполнитель "убивается" на countdown-й записи блока
+    """
+
+    countdown: int = 0
+    written: int = 0
+    "Записано байт за все попытки"
+
+    def open_write(self, path: str, offset: int = 0):
+        return KillingWriter(super().open_write(path, offset), self)
+
+
+class SlowFS(MemoryFS):
+    """
+    Удаленная FS: листинг и открытие файла занимают delay секунд, учитывается число одновременных обращений
+    """
+
+    def __init__(self, *files: FileInfo, delay: float = 0.1):
+        super().__init__(*files)
+        self.delay = delay
+        self.active = self.max_active = 0
+        self.lock = threading.Lock()
+
+    def _busy(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+
+    def ls(self, path_to_folder: str = None):
+        self._busy()
+        return super().ls(path_to_folder)
+
+    def open_read(self, path: str, offset: int = 0):
+        self._busy()
+        return super().open_read(path, offset)
+
+
+def test_record_table_rows():
+    files = [file_info("/Фото/a.jpg", 10), file_info("/b.txt", 20, md5=None)]
+    table = RecordTable(files)
+    assert len(table) == 2
+    row = table.get("/Фото/a.jpg")
+    assert (row.path, row.name, row.size) == ("/Фото", "a.jpg", 10)
+    assert row.modified == files[0].modified
+    assert (row.md5, row.sha256) == (files[0].md5, files[0].sha256)
+    assert row == files[0] and hash(row) == hash(files[0])
+    assert table[-1].md5 is None
+    assert "/b.txt" in table and "/c.txt" not in table
+    assert [row.full_name for row in table] == ["/Фото/a.jpg", "/b.txt"]
+    with pytest.raises(ValueError):
+        table.append(file_info("/c.txt", md5="ab" * 8))
+    assert len(table) == 2 and table[-1].sha256 == files[1].sha256
+
+
+def test_layer_index():
+    fs = MemoryFS(file_info("/a.txt"), file_info("/dir/b.txt"))
+    layer = FSLayer("local", fs, {})
+    assert layer.find_file("/a.txt").full_name == "/a.txt"
+    assert layer.exist("/dir/b.txt") and not layer.exist("/c.txt")
+    layer.touch("/c.txt")
+    layer.cp("/a.txt", "/d.txt")
+    layer.rm("/dir")
+    assert sorted(file.full_name for file in layer.ls()) == ["/a.txt", "/c.txt", "/d.txt"]
+    assert fs.ls_calls == 1
+
+    pool = FSLayersPool()
+    pool.attach(layer)
+    pool.attach(FSLayer("table", MemoryFS(), {}))
+    pool["table"]._index = RecordTable([file_info("/a.txt", 2)])
+    found = pool.find_file("/a.txt")
+    assert [(item.fs.key, item.resource.size) for item in found] == [("local", 1), ("table", 2)]
+
+
+def test_merge_chains():
+    local = FSLayer("local", MemoryFS(file_info("/b.txt"), file_info("/a.txt")), {})
+    cloud = FSLayer("cloud", MemoryFS(), {})
+    cloud._index = RecordTable([file_info("/c.txt"), file_info("/a.txt")])
+    nas = FSLayer("nas", MemoryFS(file_info("/a.txt", md5="01" * 16), file_info("/c.txt")), {})
+    node = Node("node", "/", [local, cloud, nas])
+    chains = list(merge_chains([layer.sorted_files() for layer in node.layers]))
+    assert [(chain.full_name, chain.present, chain.equal) for chain in chains] == [
+        ("/a.txt", [True, True, True], False),
+        ("/b.txt", [True, False, False], False),
+        ("/c.txt", [False, True, True], False),
+    ]
+    nas.fs.files["/a.txt"] = file_info("/a.txt")
+    nas.refresh()
+    chains = UnionFS("/", [node])._build_chains(node)
+    assert [(chain.full_name, chain.count) for chain in chains] == [("/c.txt", 2), ("/b.txt", 1)]
+    chains = UnionFS("/", [node])._build_chains(node, {"/b.txt", "/a.txt"})
+    assert [chain.full_name for chain in chains] == ["/b.txt"]
+
+
+def test_hash_index_layers():
+    # Слои разных узлов с одинаковыми ключами
+    photos = FSLayer("cloud", MemoryFS(file_info("/a.jpg", md5="01" * 16)), {})
+    docs = FSLayer("cloud", MemoryFS(file_info("/b.txt", md5="02" * 16)), {})
+    index = HashIndex()
+    index.add_layer(photos)
+    assert not index.indexed(docs)
+    index.add_layer(docs)
+    assert index.indexed(photos) and index.indexed(docs)
+    assert [item.fs for item in index.find(HashOfFile.of(photos.get("/a.jpg")))] == [photos]
+    index.remove_layer(docs)
+    assert index.indexed(photos) and not index.indexed(docs)
+    assert not index.find(HashOfFile.of(docs.get("/b.txt")))
+    assert index.find(HashOfFile.of(photos.get("/a.jpg")))[0].fs is photos
+
+
+def test_plan_inside_layer():
+    cloud = FSLayer("cloud", MemoryFS(file_info("/old/a.txt", md5="01" * 16)), {})
+    local = FSLayer("local", MemoryFS(file_info("/new/a.txt", md5="01" * 16)), {})
+    union = UnionFS("/", [node := Node("node", "/", [local, cloud])])
+    for layer in node.layers:
+        union.hashes.add_layer(layer)
+    source = local.get("/new/a.txt")
+    moved = set()
+    op = union._plan_inside_layer(node, source, cloud, moved)
+    # Файл был только в облачном слое: перемещается, а не копируется
+    assert (op.kind, op.path, op.target, op.source_path) == ("rename", "/new/a.txt", "cloud", "/old/a.txt")
+    assert moved == {"/old/a.txt"}
+    assert union.execute(Plan([op])) == [] and op.done
+    assert not cloud.exist("/old/a.txt") and cloud.exist("/new/a.txt")
+    content = HashOfFile.of(source)
+    assert sorted(item.fs.key for item in union.hashes.find(content)) == ["cloud", "local"]
+    assert union.hashes.find(content, cloud)[0].resource.full_name == "/new/a.txt"
+    other = file_info("/b.txt", md5="02" * 16)
+    assert union._plan_inside_layer(node, other, cloud, moved) is None
+
+
+def test_local_hashes(tmp_path):
+    data = {f"/file_{num}.bin": bytes([num]) * (num * 300_000) for num in range(4)}
+    for full_name, content in data.items():
+        (tmp_path / full_name[1:]).write_bytes(content)
+    fs = LocalFS(str(tmp_path))
+    expected = {
+        full_name: HashOfFile(
+            hashlib.md5(content).hexdigest(),
+            hashlib.sha256(content).hexdigest(),
+            len(content),
+        )
+        for full_name, content in data.items()
+    }
+    assert fs.get_hash("/file_1.bin") == expected["/file_1.bin"]
+    assert dict(fs.get_hashes(data)) == expected
+
+
+def test_local_hash_cache(tmp_path):
+    for num in range(3):
+        (tmp_path / f"file_{num}.bin").write_bytes(bytes([num]) * 1000)
+    files = [f"/file_{num}.bin" for num in range(3)]
+    with HashCache(tmp_path / "hashes.sqlite") as cache:
+        fs = LocalFS(str(tmp_path / ""), hash_cache=cache)
+        first = dict(fs.get_hashes(files))
+        assert cache.stats() == {"hits": 0, "misses": 3}
+        (tmp_path / "file_2.bin").write_bytes(b"changed")
+        second = dict(fs.get_hashes(files))
+        assert cache.stats() == {"hits": 2, "misses": 4}
+    assert first["/file_0.bin"] == second["/file_0.bin"]
+    assert second["/file_2.bin"].size == len(b"changed")
+    # Кэш переживает перезапуск
+    with HashCache(tmp_path / "hashes.sqlite") as cache:
+        LocalFS(str(tmp_path), hash_cache=cache).get_hash("/file_1.bin")
+        assert cache.hits == 1
+    # Хэш, посчитанный get_hash, сохранен без закрытия кэша
+    (tmp_path / "file_3.bin").write_bytes(b"new")
+    LocalFS(str(tmp_path), hash_cache=HashCache(tmp_path / "hashes.sqlite")).get_hash("/file_3.bin")
+    with LocalFS(str(tmp_path), hash_cache=HashCache(tmp_path / "hashes.sqlite")) as fs:
+        fs.get_hash("/file_3.bin")
+        assert fs.hash_cache.stats() == {"hits": 1, "misses": 0}
+
+
+def test_record_table_save_load(tmp_path):
+    table = RecordTable([file_info("/a.txt", 10), file_info("/Фото/b.jpg", md5=None)])
+    table.save(str(tmp_path / "table"), revision="42")
+    loaded, meta = RecordTable.load(str(tmp_path / "table"))
+    assert meta == {"revision": "42"}
+    assert [repr(row) for row in loaded] == [repr(row) for row in table]
+
+
+def test_incremental_sync(tmp_path, monkeypatch):
+    files = [file_info(f"/file_{num}.txt", num) for num in range(3)]
+    local = FSLayer("local", local_fs := MemoryFS(*files), {})
+    cloud = FSLayer("cloud", cloud_fs := FeedFS(*files), {})
+    union = UnionFS("/", [node := Node("node", "/", [local, cloud])], str(tmp_path))
+    union.sync()
+    assert (local_fs.ls_calls, cloud_fs.ls_calls) == (1, 1)
+
+    checked = []
+    build_chains = UnionFS._build_chains
+
+    def spy(self, node, paths=None):
+        checked.append(set(paths))
+        return build_chains(self, node, paths)
+
+    monkeypatch.setattr(UnionFS, "_build_chains", spy)
+    local_fs.files["/new.txt"] = file_info("/new.txt", 5)
+    cloud_fs.put(file_info("/new.txt", 5))
+    union = UnionFS("/", [node], str(tmp_path))
+    union.sync()
+    assert checked == [{"/new.txt"}]
+    # Облако отдало изменения лентой, без листинга
+    assert cloud_fs.ls_calls == 1
+    assert cloud.exist("/new.txt") and cloud.exist("/file_0.txt")
+    assert RecordTable.load(str(tmp_path / "node.cloud.snapshot"))[1]["revision"] == "1"
+
+
+def test_local_walk(tmp_path):
+    expected = {}
+    for folder in ("", "a", "a/b", "c"):
+        (tmp_path / folder).mkdir(parents=True, exist_ok=True)
+        for num in range(3):
+            full_name = f"/{folder}/file_{num}.txt".replace("//", "/")
+            (tmp_path / full_name[1:]).write_bytes(b"x" * num)
+            expected[full_name] = num
+    fs = LocalFS(str(tmp_path), walk_workers=3)
+    files = list(fs.ls())
+    assert {file.full_name: file.size for file in files} == expected
+    file = fs.get("/a/b/file_2.txt")
+    assert (file.path, file.name, file.md5) == ("/a/b", "file_2.txt", None)
+    assert fs.get("/a").is_folder and fs.get("/missing") is None
+
+    layer = FSLayer("local", fs, {})
+    layer.cp("/a/file_1.txt", "/d/copy.txt")
+    layer.rm("/a/b")
+    assert layer.get("/d/copy.txt").size == 1
+    assert not layer.exist("/a/b/file_0.txt")
+    assert {file.full_name for file in layer.ls()} == {file.full_name for file in fs.ls()}
+
+
+def test_local_walk_errors(tmp_path, monkeypatch):
+    for folder in ("a", "b", "b/c"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "file.txt").write_bytes(b"x")
+    scandir = os.scandir
+
+    def denied(path):
+        if str(path).endswith("b"):
+            raise PermissionError(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, "scandir", denied)
+    errors = []
+    files = LocalFS(str(tmp_path)).walk(onerror=errors.append)
+    # Нечитаемый каталог пропускается вместе с подкаталогами, остальные читаются
+    assert [file.full_name for file in files] == ["/a/file.txt"]
+    assert [type(error) for error in errors] == [PermissionError]
+
+
+def test_parallel_sync():
+    files = [file_info("/a.txt")]
+    remote = SlowFS(*files)
+    nodes = [
+        Node(
+            f"node{num}",
+            f"/{num}",
+            [
+                FSLayer(f"local{num}", SlowFS(*files), {}),
+                FSLayer(f"cloud{num}", SlowFS(*files), {}),
+                # Общее удаленное хранилище, не более двух листингов одновременно
+                FSLayer(f"remote{num}", remote, {"concurrency": 2}),
+            ],
+        )
+        for num in range(6)
+    ]
+    stages = []
+    union = UnionFS("/", nodes, workers=6, progress=lambda report: stages.append(report.stage))
+    start = time.perf_counter()
+    reports = union.sync()
+    # Последовательно: 6 узлов * 3 слоя * 0.1 с
+    assert time.perf_counter() - start < 1.2
+    assert remote.max_active <= 2
+    assert max(layer.fs.max_active for layer in nodes[0].layers[:2]) == 1
+    assert [report.node for report in reports] == [node.name for node in nodes]
+    assert all(report.stage == "done" for report in reports)
+    assert reports[0].timings["listing"] >= 0.1
+    assert stages.count("listing") == stages.count("done") == 6
+
+
+def test_transfer_source_slot():
+    source = SlowFS(delay=0.05)
+    for num in range(3):
+        source.put_data(f"/file_{num}.bin", b"data")
+    layers = [
+        FSLayer("source", source, {"concurrency": 1}),
+        *(FSLayer(f"target{num}", MemoryFS(), {}) for num in range(3)),
+    ]
+    reports = UnionFS("/", [Node("node", "/", layers)], workers=3).sync()
+    assert reports[0].failed == 0 and len(reports[0].operations) == 9
+    # Цели принимают файлы параллельно, но источник не читается больше чем одним потоком
+    assert source.max_active == 1
+
+
+def test_rank_sources():
+    gb = 2**30
+    nas = FSLayer("nas", MemoryFS(), {"stats": {"throughput": 20 * 2**20, "latency": 0.01}})
+    cloud = FSLayer("cloud", MemoryFS(), {"stats": {"throughput": 100 * 2**20, "cost_per_gb": 0.09}})
+    target = FSLayer("local", MemoryFS(), {})
+    ranked = rank_sources([nas, cloud], target, 40 * gb)
+    assert [item.layer for item in ranked] == ["cloud", "nas"]
+    ranked = rank_sources([nas, cloud], target, 40 * gb, "inexpensive")
+    assert [item.layer for item in ranked] == ["nas", "cloud"]
+    assert ranked[1].cost == 40 * 0.09
+    # Та же FS, что и у цели: копирование внутри хранилища первым при любой стратегии
+    same = FSLayer("same", target.fs, {"stats": {"throughput": 1.0}})
+    assert rank_sources([cloud, same], target, gb)[0].layer == "same"
+
+    # Облако стало медленным и нестабильным: выбор переходит к NAS
+    for ok in (True, False, True, False):
+        cloud.learn_transfer(gb, 200.0, ok)
+    stats = LayerStats.of(cloud)
+    assert stats.transfers == 4 and stats.throughput < 20 * 2**20 and stats.availability < 1
+    choice = SourceChoice("/big.iso", 40 * gb, "local", "fastest", rank_sources([nas, cloud], target, 40 * gb))
+    assert choice.chosen == "nas"
+    assert json.loads(json.dumps(choice.as_dict()))["candidates"][1]["layer"] == "cloud"
+
+
+def test_sync_plan(tmp_path):
+    old = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    new = datetime(2023, 2, 1, tzinfo=timezone.utc)
+    local, cloud = MemoryFS(), MemoryFS()
+    local.put_data("/a.txt", b"new version", new)
+    cloud.put_data("/a.txt", b"old", old)
+    local.put_data("/b.txt", b"b" * 100)
+    local.put_data("/new/m.txt", b"moved")
+    cloud.put_data("/old/m.txt", b"moved")
+    # Разное содержимое с одним временем изменения
+    local.put_data("/c.txt", b"c1", old)
+    cloud.put_data("/c.txt", b"c2", old)
+    node = Node("node", "/", [FSLayer("local", local, {}), FSLayer("cloud", cloud, {})])
+    union = UnionFS("/", [node])
+
+    plan = union.plan()
+    assert [(op.kind, op.path, op.target, op.source) for op in plan.operations] == [
+        ("copy", "/a.txt", "cloud", "local"),
+        ("conflict", "/c.txt", None, None),
+        ("copy", "/b.txt", "cloud", "local"),
+        ("rename", "/new/m.txt", "cloud", "cloud"),
+    ]
+    assert plan.operations[3].source_path == "/old/m.txt"
+    assert plan.transfer_bytes() == len(b"new version") + 100
+    assert plan.summary()["conflict"] == {"count": 1, "bytes": 2}
+    assert plan.estimated_seconds() > 0
+    assert list(plan.by_layer()) == [("node", "cloud")]
+    # Пробный прогон не изменяет слои
+    assert cloud.data["/a.txt"] == b"old" and "/b.txt" not in cloud.files
+
+    plan.save(str(tmp_path / "plan.json"))
+    loaded = Plan.load(str(tmp_path / "plan.json"))
+    assert loaded == plan
+    # Прерванный план: копирование /b.txt уже выполнено
+    loaded.operations[2].done = True
+    not_done = union.execute(loaded)
+    assert [op.path for op in not_done] == ["/c.txt"]
+    assert not loaded.pending()
+    assert cloud.data["/a.txt"] == b"new version"
+    assert cloud.files["/a.txt"].modified == new
+    assert "/b.txt" not in cloud.files
+    assert cloud.data["/new/m.txt"] == b"moved" and "/old/m.txt" not in cloud.files
+    assert union.plan().summary()["copy"] == {"count": 1, "bytes": 100}
+
+
+def test_local_streams(tmp_path):
+    fs = LocalFS(str(tmp_path))
+    with fs.open_write("/dir/a.bin") as file:
+        file.write(b"0123456789")
+    with fs.open_write("/dir/a.bin", 4) as file:
+        file.write(b"xy")
+    with fs.open_read("/dir/a.bin", 2) as file:
+        assert file.read() == b"23xy"
+    modified = datetime(2023, 1, 31, tzinfo=timezone.utc)
+    fs.set_modified("/dir/a.bin", modified)
+    assert fs.get("/dir/a.bin").modified == modified
+
+
+def test_resume_after_kill(tmp_path, monkeypatch):
+    monkeypatch.setattr(FSLayer, "CHUNK_SIZE", 1024)
+    rnd = random.Random(25)
+    data = {
+        f"/dir_{num % 2}/file_{num}.bin": rnd.randbytes(rnd.randint(1, 20) * 1000)
+        for num in range(8)
+    }
+    for full_name, content in data.items():
+        (tmp_path / "local" / full_name[1:]).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "local" / full_name[1:]).write_bytes(content)
+    (tmp_path / "remote").mkdir()
+    remote = KillingFS(str(tmp_path / "remote"))
+
+    def restart() -> UnionFS:
+        # Новый процесс: слои и индексы создаются заново
+        layers = [
+            FSLayer("local", LocalFS(str(tmp_path / "local")), {}),
+            FSLayer("remote", remote, {}),
+        ]
+        return UnionFS("/", [Node("node", "/", layers)], str(tmp_path / "state"))
+
+    plan = restart().plan()
+    assert plan.transfer_bytes() == sum(map(len, data.values()))
+    plan.save(str(tmp_path / "plan.json"))
+    checkpoint = str(tmp_path / "journal")
+    kills = 0
+    while True:
+        remote.countdown = rnd.randint(1, 15)
+        try:
+            not_done = restart().execute(Plan.load(str(tmp_path / "plan.json")), checkpoint)
+            break
+        except Killed:
+            kills += 1
+            if kills == 2:
+                # Процесс убит во время записи в журнал
+                with open(checkpoint, "a") as file:
+                    file.write('{"op": "node')
+    assert kills > 3 and not_done == []
+    assert not os.path.exists(checkpoint)
+    assert {file.full_name: file.size for file in remote.ls()} == {
+        full_name: len(content) for full_name, content in data.items()
+    }
+    for full_name, content in data.items():
+        assert (tmp_path / "remote" / full_name[1:]).read_bytes() == content
+    # Прерванные передачи продолжены, а не начаты заново: повторно записано не больше блока на сбой
+    assert remote.written <= plan.transfer_bytes() + kills * FSLayer.CHUNK_SIZE
+    assert restart().plan().operations == []
+
+
+def test_same_layer_keys():
+    # Ключи слоев уникальны в пределах узла, у разных узлов они совпадают
+    photos, docs = MemoryFS(), MemoryFS()
+    photos.put_data("/photo.jpg", b"photo")
+    docs.put_data("/doc.txt", b"doc")
+    nodes = [
+        Node("photos", "/photos", [FSLayer("local", photos, {}), FSLayer("cloud", MemoryFS(), {})]),
+        Node("docs", "/docs", [FSLayer("local", docs, {}), FSLayer("cloud", MemoryFS(), {})]),
+    ]
+    reports = UnionFS("/", nodes).sync()
+    assert [report.failed for report in reports] == [0, 0]
+    assert list(nodes[0].layers[1].fs.data) == ["/photo.jpg"]
+    assert list(nodes[1].layers[1].fs.data) == ["/doc.txt"]
+
+
+def test_link_replaces_stale(tmp_path):
+    for folder, files in (("a", {"x": b"new", "y": b"new"}), ("b", {"x": b"old", "y": b"new"})):
+        (tmp_path / folder).mkdir()
+        for name, content in files.items():
+            (tmp_path / folder / name).write_bytes(content)
+    os.utime(tmp_path / "b" / "x", (1, 1000))
+    for folder in ("a", "b"):
+        os.utime(tmp_path / folder / "y", (1, 2000))
+    layers = [
+        FSLayer("a", LocalFS(str(tmp_path / "a")), {}),
+        FSLayer("b", LocalFS(str(tmp_path / "b")), {"links": True}),
+    ]
+    for layer in layers:
+        for file in list(layer.ls()):
+            content = layer.fs.get_hash(file.full_name)
+            layer.remember(dataclasses.replace(file, md5=content.md5, sha256=content.sha256))
+    reports = UnionFS("/", [Node("node", "/", layers)]).sync()
+    assert [(op.kind, op.path, op.source_path, op.done) for op in reports[0].operations] == [
+        ("link", "/x", "/y", True)
+    ]
+    assert (tmp_path / "b" / "x").read_bytes() == b"new"
+    assert os.path.samefile(tmp_path / "b" / "x", tmp_path / "b" / "y")
+
+
+def test_journal_file_versions(tmp_path):
+    first, second, third = (datetime(2023, month, 1, tzinfo=timezone.utc) for month in (1, 2, 3))
+    local, cloud = MemoryFS(), MemoryFS()
+    local.put_data("/a.txt", b"AAAA", second)
+    cloud.put_data("/a.txt", b"aaaa", first)
+    local.put_data("/b.txt", b"BBBB", second)
+    open_write = cloud.open_write
+
+    def no_quota(path: str, offset: int = 0):
+        if path.startswith("/b.txt"):
+            raise OSError("quota")
+        return open_write(path, offset)
+
+    cloud.open_write = no_quota
+    node = Node("node", "/", [FSLayer("local", local, {}), FSLayer("cloud", cloud, {})])
+    assert UnionFS("/", [node], str(tmp_path)).sync()[0].failed == 1
+    # Журнал остался из-за неудачи, но выполненное после сохранения снимков из него удалено
+    assert '"done"' not in (tmp_path / "node.journal").read_text()
+
+    # Файл изменен с тем же размером: это новая операция, а не выполненная ранее
+    local.put_data("/a.txt", b"ZZZZ", third)
+    UnionFS("/", [node], str(tmp_path)).sync()
+    assert cloud.data["/a.txt"] == b"ZZZZ"
+    cloud.open_write = open_write
+    report = UnionFS("/", [node], str(tmp_path)).sync()[0]
+    assert [(op.path, op.done) for op in report.operations] == [("/b.txt", True)]
+    assert not (tmp_path / "node.journal").exists()
+
+
+def test_resume_changed_source(tmp_path):
+    (tmp_path / "remote").mkdir()
+    local, remote = MemoryFS(), LocalFS(str(tmp_path / "remote"))
+    local.put_data("/f.bin", b"NEW!DATA")
+    node = Node("node", "/", [FSLayer("local", local, {}), FSLayer("remote", remote, {})])
+    plan = UnionFS("/", [node]).plan()
+    checkpoint = str(tmp_path / "journal")
+    # Передача прервана, когда в источнике была другая версия того же размера
+    with Journal(checkpoint) as journal:
+        journal.record_offset(plan.operations[0], "local", 4)
+    with remote.open_write("/f.bin" + UnionFS.PARTIAL_SUFFIX) as file:
+        file.write(b"OLD!")
+    assert UnionFS("/", [node]).execute(plan, checkpoint) == []
+    assert (tmp_path / "remote" / "f.bin").read_bytes() == b"NEW!DATA"
+
+    # План составлен до изменения источника: прерванная передача не продолжается
+    local.put_data("/g.bin", b"old")
+    node.layers[0].refresh()
+    plan = UnionFS("/", [node]).plan()
+    assert [op.path for op in plan.operations] == ["/g.bin"]
+    local.put_data("/g.bin", b"NEWER", datetime(2024, 1, 1, tzinfo=timezone.utc))
+    with Journal(checkpoint) as journal:
+        journal.record_offset(plan.operations[0], "local", 3)
+    with remote.open_write("/g.bin" + UnionFS.PARTIAL_SUFFIX) as file:
+        file.write(b"old")
+    node.layers[0].refresh()
+    assert UnionFS("/", [node]).execute(plan, checkpoint) == []
+    assert (tmp_path / "remote" / "g.bin").read_bytes() == b"NEWER"
+
+    # Продолженная передача без расхождений сверяется с источником один раз
+    local.put_data("/h.bin", b"HALFDONE")
+    node.layers[0].refresh()
+    plan = UnionFS("/", [node]).plan()
+    with Journal(checkpoint) as journal:
+        journal.record_offset(plan.operations[0], "local", 4)
+    with remote.open_write("/h.bin" + UnionFS.PARTIAL_SUFFIX) as file:
+        file.write(b"HALF")
+    hashed, get_hash = [], remote.get_hash
+    remote.get_hash = lambda path: hashed.append(path) or get_hash(path)
+    assert UnionFS("/", [node]).execute(plan, checkpoint) == []
+    assert hashed == ["/h.bin" + UnionFS.PARTIAL_SUFFIX]
+    assert (tmp_path / "remote" / "h.bin").read_bytes() == b"HALFDONE"
+
+
+def test_local_rename(tmp_path):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "old.txt").write_bytes(b"same")
+    layers = [FSLayer(key, LocalFS(str(tmp_path / key)), {}) for key in ("a", "b")]
+    node = Node("node", "/", layers)
+    assert UnionFS("/", [node], str(tmp_path / "state")).sync()[0].operations == []
+    # Хэши локальных файлов посчитаны при полной синхронизации и сохранены в снимках
+    (tmp_path / "a" / "old.txt").rename(tmp_path / "a" / "new.txt")
+    for layer in layers:
+        layer.refresh()
+    report = UnionFS("/", [node], str(tmp_path / "state")).sync()[0]
+    assert [(op.kind, op.target, op.path, op.source_path) for op in report.operations] == [
+        ("rename", "b", "/new.txt", "/old.txt")
+    ]
+    assert sorted(os.listdir(tmp_path / "b")) == ["new.txt"]
+
+    # Без снимков: локальный файл сверяется по хэшу с файлом облака под другим именем
+    cloud = MemoryFS()
+    cloud.put_data("/old.txt", b"same")
+    layers = [FSLayer("local", LocalFS(str(tmp_path / "a")), {}), FSLayer("cloud", cloud, {})]
+    plan = UnionFS("/", [Node("full", "/", layers)]).plan()
+    assert [(op.kind, op.target, op.path) for op in plan.operations] == [
+        ("rename", "cloud", "/new.txt")
+    ]
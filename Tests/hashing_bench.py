@@ -0,0 +1,42 @@
+"""
+Замер пропускной способности хэширования (md5 + sha256 за один проход)
+
+Запуск из корня проекта:
+    python -m Tests.hashing_bench [количество_файлов] [размер_файла_МБ]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from hashing import HashEngine
+
+
+def bench_hashing(count: int, size_mb: int):
+    with tempfile.TemporaryDirectory() as folder:
+        paths = []
+        block = os.urandom(1 << 20)
+        for num in range(count):
+            paths.append(path := os.path.join(folder, f"file_{num}.bin"))
+            with open(path, "wb") as file:
+                for _ in range(size_mb):
+                    file.write(block)
+        total_gb = count * size_mb / 1024
+        print(f"Хэширование {count} файлов по {size_mb} МБ (файлы в кэше ОС)")
+        for workers in sorted({1, os.cpu_count() or 1}):
+            with HashEngine(workers) as engine:
+                start = time.perf_counter()
+                for _ in engine.hash_files(paths):
+                    pass
+                elapsed = time.perf_counter() - start
+            print(
+                f"workers={workers:<3} {total_gb / elapsed:6.2f} ГБ/с, "
+                f"{total_gb / elapsed / workers:6.2f} ГБ/с на ядро"
+            )
+
+
+if __name__ == "__main__":
+    bench_hashing(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 16,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 64,
+    )
@@ -0,0 +1,179 @@
+"""
+Замеры скорости декодирования record-классов на синтетическом листинге Яндекс.Диска
+
+Запуск из корня проекта:
+    python -m Tests.record_bench [количество_элементов]
+"""
+import inspect
+import sys
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+import dateutil.parser
+
+from record import _parse_datetime, record
+
+
+def listing_item(num: int) -> dict:
+    """
+    Элемент _embedded.items ответа Яндекс.Диска
+    """
+    return {
+        "name": f"file_{num}.jpg",
+        "path": f"disk:/Фотокамера/file_{num}.jpg",
+        "type": "file",
+        "mime_type": "image/jpeg",
+        "media_type": "image",
+        "created": "2023-01-31T17:17:57+00:00",
+        "modified": (datetime(2023, 1, 31) + timedelta(seconds=num)).isoformat() + "+00:00",
+        "size": 1024 + num,
+        "md5": f"{num:032x}",
+        "sha256": f"{num:064x}",
+        "resource_id": f"56091251:{num:064x}",
+        "revision": 1675185477609069 + num,
+        "antivirus_status": "clean",
+        "file": f"https://downloader.disk.yandex.ru/disk/{num}",
+    }
+
+
+def listing(count: int) -> list[dict]:
+    return [listing_item(num) for num in range(count)]
+
+
+def make_classes(**params):
+    @record(**params)
+    class ListingItem:
+        name: str
+        path: str
+        type: str
+        mime_type: str
+        media_type: str
+        created: datetime
+        modified: datetime
+        size: int
+        md5: str
+        sha256: str
+        resource_id: str
+        revision: int
+
+    return ListingItem
+
+
+def bench(title: str, fn, number: int = 1):
+    elapsed = min(timeit.repeat(fn, number=number, repeat=3))
+    print(f"{title:<40} {elapsed:8.3f} s")
+    return elapsed
+
+
+def bench_decoder(count: int):
+    items = listing(count)
+    reflective = make_classes(compiled=False)
+    compiled = make_classes()
+    print(f"Декодирование листинга из {count} элементов")
+    slow = bench("reflection (compiled=False)", lambda: [reflective(item) for item in items])
+    fast = bench("compiled decoder", lambda: [compiled(item) for item in items])
+    print(f"{'speedup':<40} {slow / fast:8.2f} x")
+    batch = bench("from_dicts(as_list=True)", lambda: compiled.from_dicts(items, as_list=True))
+    print(f"{'speedup':<40} {slow / batch:8.2f} x")
+
+
+def bench_lazy(count: int):
+    """
+    Декодирование листинга с чтением двух полей из каждого элемента:
+    время и пиковая память сверх уже загруженного листинга
+    """
+    items = listing(count)
+    print(f"Листинг из {count} элементов, чтение полей name и size")
+    for title, params in (("compiled", {}), ("lazy", {"lazy": True})):
+        item_cls = make_classes(**params)
+
+        def read():
+            return [(obj.name, obj.size) for obj in item_cls.from_dicts(items, as_list=True)]
+
+        elapsed = min(timeit.repeat(read, number=1, repeat=3))
+        tracemalloc.start()
+        read()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{title:<40} {elapsed:8.3f} s {peak / 2**20:8.1f} MiB")
+
+
+def bench_datetime(count: int = 20_000):
+    """
+    Стоимость разбора поля datetime: dateutil, fromisoformat на уникальных строках (промахи кеша),
+    повторяющиеся строки (попадания в кеш)
+    """
+    start = datetime(2023, 1, 31, 17, 17, 57)
+    unique = [(start + timedelta(seconds=num)).isoformat() + "+00:00" for num in range(count)]
+    repeated = unique[:100] * (count // 100)
+    print(f"Разбор {count} строк ISO 8601, мкс на строку")
+    for title, fn in (
+        ("dateutil.parser.parse", lambda: [dateutil.parser.parse(s) for s in unique]),
+        ("fromisoformat, уникальные строки", lambda: [_parse_datetime.__wrapped__(s) for s in unique]),
+        ("fromisoformat + кеш, повторы", lambda: [_parse_datetime(s) for s in repeated]),
+    ):
+        elapsed = min(timeit.repeat(fn, number=1, repeat=3))
+        print(f"{title:<40} {elapsed / count * 1e6:8.2f}")
+
+
+def bench_wide(count: int = 2000, width: int = 100):
+    """
+    Декодирование словаря из width ключей в объект из width полей, половина полей отсутствует в словаре
+    """
+    annotations = {f"field{num}": int for num in range(width)}
+    payload = {f"field{num}": num for num in range(0, width, 2)}
+    payload |= {f"extra{num}": num for num in range(width // 2)}
+    print(f"Словарь из {len(payload)} ключей, {width} полей, мкс на объект")
+    for compiled in (False, True):
+        wide = record(compiled=compiled)(type("Wide", (), {"__annotations__": annotations}))
+        elapsed = min(timeit.repeat(lambda: wide(payload), number=count, repeat=3))
+        print(f"{'compiled' if compiled else 'reflection':<40} {elapsed / count * 1e6:8.1f}")
+
+
+@record
+class Folder:
+    owner: "Owner"
+    items: "list[str]"
+
+
+@record
+class Owner:
+    login: str
+
+
+def at_depth(depth: int, fn):
+    if depth <= 1:
+        return fn()
+    return at_depth(depth - 1, fn)
+
+
+def stack_resolve(name: str):
+    """
+    Прежнее разрешение строковой аннотации: поиск имени в globals всех кадров inspect.stack()
+    """
+    for stack in inspect.stack():
+        if name in stack.frame.f_globals:
+            return stack.frame.f_globals[name]
+
+
+def bench_stack_depth(count: int = 1000):
+    print("Разрешение строковых аннотаций на глубине стека, мкс на вызов")
+    source = {"owner": {"login": "kale-ru"}, "items": ["a", "b"]}
+    for depth in (1, 30, 60):
+        start = time.perf_counter()
+        at_depth(depth, lambda: [Folder(source) for _ in range(count)])
+        decode = (time.perf_counter() - start) / count * 1e6
+        start = time.perf_counter()
+        at_depth(depth, lambda: [stack_resolve("Owner") for _ in range(count // 10)])
+        stack = (time.perf_counter() - start) / (count // 10) * 1e6
+        print(f"depth={depth:<3} Folder(): {decode:8.1f}   inspect.stack(): {stack:8.1f}")
+
+
+if __name__ == "__main__":
+    bench_decoder(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
+    bench_lazy(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
+    bench_datetime()
+    bench_wide()
+    bench_stack_depth()
@@ -0,0 +1,247 @@
+import gc
+import tracemalloc
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import pytest
+
+import record as record_module
+from dataclasses import MISSING
+from record import record, record_source, T_MissingFieldBehavior, T_MissingKeyBehavior
+
+
+@record
+class UserInfo:
+    login: str
+    uid: str
+
+
+@record
+class DiskInfo:
+    total_space: int
+    is_paid: bool
+    modified: datetime
+    system_folders: dict[str, str]
+    user: UserInfo
+    new_name: str
+    kind: str = "disk"
+
+
+@record
+class Owner:
+    pet: "Pet"
+    pets: "list[Pet]"
+
+
+@record
+class Pet:
+    name: str
+
+
+SOURCE = {
+    "total_space": "2289217568768",
+    "is_paid": True,
+    "modified": "2023-01-31T17:17:57+00:00",
+    "system_folders": {"downloads": "disk:/Загрузки/"},
+    "user": {"login": "kale-ru", "uid": "56091251"},
+    "kind": "ignored",
+    "revision": "1675185477609069",
+}
+
+
+def test_compiled_decoder():
+    info = DiskInfo(SOURCE)
+    assert info.total_space == 2289217568768
+    assert info.is_paid is True
+    assert info.modified == datetime(2023, 1, 31, 17, 17, 57, tzinfo=timezone.utc)
+    assert info.system_folders == {"downloads": "disk:/Загрузки/"}
+    assert isinstance(info.user, UserInfo)
+    assert (info.user.login, info.user.uid) == ("kale-ru", "56091251")
+    assert info.new_name is MISSING
+    assert info.kind == "disk"
+    assert info.revision == "1675185477609069"
+
+
+def test_behavior_overrides():
+    info = DiskInfo(
+        SOURCE,
+        missing_key_behavior=T_MissingKeyBehavior.store_as_internal,
+        missing_field_behavior=T_MissingFieldBehavior.store_as_None,
+    )
+    assert info.new_name is None
+    assert info.__missing_keys__ == {"revision": "1675185477609069"}
+    assert not hasattr(info, "revision")
+    # Переопределение действует только на один вызов
+    info = DiskInfo(SOURCE)
+    assert info.new_name is MISSING and info.revision == "1675185477609069"
+
+
+def test_behavior_per_call_in_threads():
+    behaviors = [T_MissingFieldBehavior.store_as_None, None] * 200
+    reflective = record(compiled=False)(type("Info", (), {"__annotations__": {"login": str}}))
+
+    def decode(behavior):
+        return [
+            (cls({}, missing_field_behavior=behavior).login, cls({}).login)
+            for cls in (UserInfo, reflective)
+        ]
+
+    with ThreadPoolExecutor(8) as pool:
+        for behavior, result in zip(behaviors, pool.map(decode, behaviors)):
+            expected = None if behavior else MISSING
+            assert result == [(expected, MISSING)] * 2
+
+
+def test_from_dicts():
+    items = ({"login": f"user{num}", "uid": num} for num in range(3))
+    users = UserInfo.from_dicts(items)
+    assert not isinstance(users, list)
+    assert [(user.login, user.uid) for user in users] == [
+        ("user0", "0"),
+        ("user1", "1"),
+        ("user2", "2"),
+    ]
+    users = UserInfo.from_dicts([{"login": "kale-ru"}], as_list=True)
+    assert isinstance(users, list)
+    assert users[0].uid is MISSING
+
+
+def test_forward_references():
+    owner = Owner({"pet": {"name": "Рыжик"}, "pets": ({"name": "Барсик"},)})
+    assert isinstance(owner.pet, Pet) and owner.pet.name == "Рыжик"
+    assert owner.pets == [{"name": "Барсик"}]
+    assert Owner.__record_types__ == {"pet": Pet, "pets": list[Pet]}
+
+
+@record(compiled=False)
+class ReflectiveOwner:
+    user: UserInfo
+
+
+def test_dotted_keys():
+    source = {"user.login": "kale-ru", "user.uid": 56091251}
+    for info in (DiskInfo(source), ReflectiveOwner(source)):
+        assert (info.user.login, info.user.uid) == ("kale-ru", "56091251")
+        assert not hasattr(info, "user.login")
+    info = DiskInfo({"user": {"login": "kale-ru", "uid": "1"}, "user.uid": "2"})
+    assert (info.user.login, info.user.uid) == ("kale-ru", "2")
+
+
+def wide_record(width: int, **params) -> type:
+    annotations = {f"field{num}": int for num in range(width)}
+    return record(**params)(type("Wide", (), {"__annotations__": annotations}))
+
+
+def test_wide_dict():
+    # Заполнена половина полей, столько же ключей не имеют пары в полях
+    payload = {f"field{num}": str(num) for num in range(0, 100, 2)}
+    payload |= {f"extra{num}": num for num in range(50)}
+    objects = [
+        wide_record(100, compiled=compiled)(payload) for compiled in (True, False)
+    ]
+    for obj in objects:
+        assert obj.field0 == 0 and obj.field98 == 98
+        assert obj.field1 is MISSING and obj.field99 is MISSING
+        assert obj.extra49 == 49
+    assert vars(objects[0]) == vars(objects[1])
+    obj = wide_record(100, compiled=False)({})
+    assert all(value is MISSING for value in vars(obj).values()) and len(vars(obj)) == 100
+
+
+def test_datetime_formats():
+    expected = datetime(2023, 1, 31, 17, 17, 57, tzinfo=timezone.utc)
+    for modified in ("2023-01-31T17:17:57Z", "Tue, 31 Jan 2023 17:17:57 +0000"):
+        assert DiskInfo({"modified": modified}).modified == expected
+
+
+@record(lazy=True)
+class LazyDiskInfo(DiskInfo):
+    __annotations__ = DiskInfo.__annotations__
+
+
+def test_lazy():
+    info = LazyDiskInfo(SOURCE)
+    assert "total_space" not in vars(info) and vars(info)["__record_raw__"] is SOURCE
+    assert info.total_space == 2289217568768
+    assert vars(info)["total_space"] == 2289217568768
+    assert info.modified == datetime(2023, 1, 31, 17, 17, 57, tzinfo=timezone.utc)
+    assert (info.user.login, info.revision) == ("kale-ru", "1675185477609069")
+    assert info.new_name is MISSING and info.kind == "disk"
+    assert {"is_paid", "revision", "system_folders"} <= set(dir(info))
+    info = LazyDiskInfo(
+        {"user.login": "kale-ru", "revision": "1"},
+        missing_key_behavior=T_MissingKeyBehavior.store_as_internal,
+        missing_field_behavior=T_MissingFieldBehavior.store_as_None,
+    )
+    assert info.user.login == "kale-ru" and info.modified is None
+    assert info.__missing_keys__ == {"revision": "1"}
+    assert not hasattr(info, "revision")
+    users = UserInfo.from_dicts([{"login": "kale-ru"}], as_list=True)
+    assert users[0].login == "kale-ru"
+
+
+def listing_peak(count: int = 2000, **params) -> int:
+    """
+    Пиковая память декодирования листинга с чтением двух полей каждого элемента, байт
+    """
+
+    @record(**params)
+    class Item:
+        name: str
+        path: str
+        mime_type: str
+        created: datetime
+        size: int
+        md5: str
+        sha256: str
+        revision: int
+
+    items = [
+        {
+            "name": f"file_{num}.jpg",
+            "path": f"disk:/file_{num}.jpg",
+            "mime_type": "image/jpeg",
+            "created": "2023-01-31T17:17:57+00:00",
+            "size": 1024 + num,
+            "md5": f"{num:032x}",
+            "sha256": f"{num:064x}",
+            "revision": 1675185477609069 + num,
+        }
+        for num in range(count)
+    ]
+    tracemalloc.start()
+    [(obj.name, obj.size) for obj in Item.from_dicts(items, as_list=True)]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+@pytest.mark.skipif(
+    not record_module._COMPACT_ATTRIBUTES, reason="компактные атрибуты объектов - CPython 3.11+"
+)
+def test_lazy_memory(monkeypatch):
+    compiled, lazy = listing_peak(), listing_peak(lazy=True)
+    assert lazy < compiled
+    # Без заполнения общих ключей атрибутов прочитанные поля хранятся в словаре каждого объекта
+    monkeypatch.setattr(record_module, "_COMPACT_ATTRIBUTES", False)
+    assert listing_peak(lazy=True) > compiled
+
+
+class Payload(dict):
+    "Словарь, на который можно получить слабую ссылку"
+
+
+def test_source_not_retained():
+    payload = Payload(SOURCE)
+    ref = weakref.ref(payload)
+    info = DiskInfo(payload)
+    assert record_source(info) is None and DiskInfo.__is_record__ == {}
+    del payload
+    gc.collect()
+    assert ref() is None
+    kept = record(keep_source=True)(type("Kept", (), {"__annotations__": {"login": str}}))
+    payload = Payload(login="kale-ru")
+    assert record_source(kept(payload)) is payload
+    assert record_source(kept.from_dicts([payload], as_list=True)[0]) is payload
+    assert record_source(LazyDiskInfo(payload)) is payload
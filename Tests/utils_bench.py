@@ -0,0 +1,51 @@
+"""
+Замер накладных расходов args_asdict на разной глубине стека вызовов
+
+Запуск из корня проекта:
+    python -m Tests.utils_bench
+"""
+import inspect
+import timeit
+
+from utils import args_asdict
+
+
+def stack_args_asdict() -> dict:
+    """
+    Прежняя реализация доступа к кадру вызывающей функции: inspect.stack()[1]
+    """
+    return dict(inspect.stack()[1].frame.f_locals)
+
+
+def api_call(path: str, limit: int = 20, **kwargs) -> dict:
+    return args_asdict()
+
+
+def old_api_call(path: str, limit: int = 20, **kwargs) -> dict:
+    return stack_args_asdict()
+
+
+def at_depth(depth: int, fn):
+    if depth <= 1:
+        return fn()
+    return at_depth(depth - 1, fn)
+
+
+def bench_args_asdict(number: int = 200):
+    print("args_asdict, мкс на вызов")
+    for depth in (1, 30, 60):
+        new = timeit.timeit(
+            lambda: at_depth(depth, lambda: api_call("/", fields="name")), number=number
+        )
+        old = timeit.timeit(
+            lambda: at_depth(depth, lambda: old_api_call("/", fields="name")),
+            number=number,
+        )
+        print(
+            f"depth={depth:<3} sys._getframe: {new / number * 1e6:8.1f}   "
+            f"inspect.stack: {old / number * 1e6:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    bench_args_asdict()
@@ -1,10 +1,13 @@
 import dataclasses
+import typing
 
 from dataclasses import dataclass, MISSING, field, InitVar, fields
 from typing import Any, ForwardRef, Callable, Self, TypeVar, Generic, Type
 from functools import partial, wraps
 import inspect
 
+from utils import resolve_annotations
+
 __DICT_SOURCE__ = "_dict_source_"
 
 
@@ -12,6 +15,49 @@ Cls = TypeVar("Cls")
 Obj = TypeVar("Obj")
 
 
+class _CoercionPlan(dict[str, tuple[type, Callable]]):
+    """
+    План приведения значений полей класса: имя поля - (тип, значения которого сохраняются как есть;
+    конвертер для остальных значений). Заполняется один раз, при первом обращении,
+    когда строковые аннотации (forward reference) уже могут быть разрешены
+    """
+
+    def __init__(self, cls):
+        super().__init__()
+        self._cls = cls
+        self._resolved = False
+
+    def __missing__(self, key):
+        if not self._resolved:
+            plan = {}
+            for name, attr_type in resolve_annotations(self._cls).items():
+                if isinstance(attr_type, dataclasses.InitVar):
+                    attr_type = attr_type.type
+                plan[name] = (typing.get_origin(attr_type) or attr_type, attr_type)
+            # План публикуется целиком и до признака: другой поток не увидит его заполненным частично
+            self.update(plan)
+            self._resolved = True
+            if key in self:
+                return self[key]
+        raise ValueError(f"attribute {key} not found")
+
+
+def _factory_arity(factory) -> int | None:
+    """
+    Количество параметров (не более двух: объект, имя поля), с которыми вызывается фабрика значения поля.
+    None - значение поля не может быть получено вызовом (не callable)
+    """
+    if isinstance(factory, dataclasses.InitVar):
+        factory = factory.type
+    if not callable(factory):
+        return None
+    try:
+        return min(len(inspect.signature(factory).parameters), 2)
+    except (TypeError, ValueError):
+        # Сигнатура встроенного типа недоступна (int, str, ...): вызов без параметров
+        return 0
+
+
 def record(
     cls=None,
     /,
@@ -32,40 +78,40 @@ def record(
         if callable(origin__getattr__):
             origin__getattr__(self, name)
 
-        if attr_type := self.__annotations__.get(name, None):
-            # Есть в аннотиции, но нет в аттрибутах: не нашлось начального значения
-            # field_type = cls_fields[name]
-            if callable(attr_type):
-                params_spec = inspect.signature(attr_type).parameters
-                params = [self, name]
-                value = attr_type(*(params[: len(params_spec)]))
-                object.__setattr__(self, name, value)
-                return value
-
+        # Есть в аннотиции, но нет в аттрибутах: не нашлось начального значения
+        attr_type = plan[name][1]
+        if (arity := arities.get(name, MISSING)) is MISSING:
+            # Аннотация не была разрешена на момент декорирования
+            arity = arities[name] = _factory_arity(attr_type)
+        if arity is None:
             return MISSING
-        else:
-            raise ValueError(f"attribute {name} not found")
+        value = attr_type(*(self, name)[:arity])
+        object.__setattr__(self, name, value)
+        return value
 
-    def __setattr__(self, key, value):
-        nonlocal origin__setattr__
-        if callable(origin__setattr__):
+    def __setattr__(self, key, value, _set=object.__setattr__):
+        if origin__setattr__ is not None:
             origin__setattr__(self, key, value)
-        if attr_type := self.__annotations__.get(key, None):
-            if type(attr_type) == str:
-                attr_type = globals()[attr_type]
-            if isinstance(attr_type, dataclasses.InitVar):
-                attr_type = attr_type.type
-            value = attr_type(value)
-            object.__setattr__(self, key, value)
-        else:
-            raise ValueError(f"attribute {key} not found")
+        exact_type, convert = plan[key]
+        if type(value) is not exact_type:
+            value = convert(value)
+        _set(self, key, value)
 
     cls = dataclass(cls, **kwargs)
+    plan = _CoercionPlan(cls)
+    arities: dict[str, int | None] = {
+        name: _factory_arity(attr_type)
+        for name, attr_type in resolve_annotations(cls).items()
+        if not isinstance(attr_type, str)
+    }
 
     # cls_fields: dict[str, type] = {name: cls.__annotations__[name] for name in fields(cls)}
     origin__getattr__ = getattr(cls, "__getattr__", None)
     cls.__getattr__ = __getattr__
     origin__setattr__ = getattr(cls, "__setattr__", None)
+    if origin__setattr__ is object.__setattr__:
+        # Значение все равно устанавливается ниже, уже приведенным к типу поля
+        origin__setattr__ = None
     cls.__setattr__ = __setattr__
     origin__post_init__ = getattr(cls, "__post_init__", None)
     cls.__post_init__ = __post_init__
@@ -85,16 +131,13 @@ def record_from(cls=None, /, **kwargs):
         else:
             raise ValueError(f"attribute {name} not found")
 
-    def __setattr__(self, key, value):
-        if attr_type := self.__annotations__.get(key, None):
-            if type(attr_type) == str:
-                attr_type = globals()[attr_type]
-            if isinstance(attr_type, dataclasses.InitVar):
-                attr_type = attr_type.type
-            value = attr_type(value)
-            object.__setattr__(self, key, value)
-        else:
-            raise ValueError(f"attribute {key} not found")
+    plan = _CoercionPlan(cls)
+
+    def __setattr__(self, key, value, _set=object.__setattr__):
+        exact_type, convert = plan[key]
+        if type(value) is not exact_type:
+            value = convert(value)
+        _set(self, key, value)
 
     cls.__getattr__ = __getattr__
     cls.__setattr__ = __setattr__
@@ -157,6 +200,33 @@ def record(cls=None, /, *, MISSING_is_None=False, **kwargs):
 
     __origin__post_init__: Callable | None = None
     init_fields: dict[str, Any] = {}
+    lazy_fields: dict[str, tuple[Any, int | None]] = {}
+    """
+    Поля без начального значения: имя - (тип поля, количество параметров его конструктора, см. _factory_arity).
+    Значение создается при первом обращении к полю
+    """
+
+    def __getattr__(self, name: str):
+        if (factory := lazy_fields.get(name)) is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        attr_type, arity = factory
+        if isinstance(attr_type, str):
+            # Аннотация не была разрешена на момент декорирования
+            attr_type = resolve_annotations(cls).get(name, attr_type)
+            arity = _factory_arity(attr_type)
+            if not isinstance(attr_type, str):
+                lazy_fields[name] = (attr_type, arity)
+        value = MISSING
+        if arity is not None:
+            try:
+                value = attr_type(*(self, name)[:arity])
+            except (TypeError, ValueError):
+                # Тип не создается без параметров (datetime, ...): поле без значения
+                value = MISSING
+        if value is MISSING and MISSING_is_None:
+            value = None
+        object.__setattr__(self, name, value)
+        return value
 
     def __post_init__(self, *args, **kwargs):
 
@@ -257,6 +327,23 @@ def record(cls=None, /, *, MISSING_is_None=False, **kwargs):
         nonlocal __origin__post_init__
         __origin__post_init__ = getattr(cls, "__post_init__", None)
         cls.__post_init__ = __post_init__
+        annotations = resolve_annotations(cls)
+        for _field in fields(cls):
+            if (
+                _field.name in init_fields
+                or _field.default is not MISSING
+                or _field.default_factory is not MISSING
+            ):
+                continue
+            attr_type = annotations.get(_field.name, _field.type)
+            if isinstance(attr_type, dataclasses.InitVar):
+                attr_type = attr_type.type
+            lazy_fields[_field.name] = (
+                attr_type,
+                None if isinstance(attr_type, str) else _factory_arity(attr_type),
+            )
+        if "__getattr__" not in vars(cls):
+            cls.__getattr__ = __getattr__
         return cls
 
     if cls is None:
@@ -2,10 +2,29 @@ import dataclasses
 import enum
 import typing as ty
 from abc import abstractmethod
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
 from typing import Protocol, runtime_checkable
 
+import contextlib
 import dataclasses
+import functools
+import heapq
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from hashing import HashCache, HashEngine
+from sync_plan import Journal, Operation, Plan
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # from Yandex import DiskAPI as ya
@@ -14,7 +33,7 @@ import dataclasses
 # from ABC
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class HashOfFile:
     md5: str
     sha256: str
@@ -23,8 +42,17 @@ class HashOfFile:
     def __hash__(self):
         return hash((self.md5, self.sha256, self.size))
 
+    @classmethod
+    def of(cls, file: "FileInfo") -> ty.Optional["HashOfFile"]:
+        """
+        Хэш файла по его описанию, None - если хэши файла неизвестны
+        """
+        if not isinstance(file.md5, str) or not isinstance(file.sha256, str):
+            return None
+        return cls(file.md5, file.sha256, file.size)
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True)
 class Resource:
     is_folder: bool
     path: bool
@@ -40,7 +68,7 @@ class Resource:
 #    full_path: str
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class FileInfo(Resource):
     # modified: datetime
     # created: datetime
@@ -60,13 +88,242 @@ class FileInfo(Resource):
     #     return hash(self.hash)
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class FolderInfo(Resource):
     ...
 
     # items: ty.Iterable[ty.Self]
 
 
+class FileRow:
+    """
+    Строка RecordTable. По атрибутам совместима с FileInfo, данные читает из колонок таблицы
+    """
+
+    __slots__ = ("table", "index")
+
+    is_folder = False
+
+    def __init__(self, table: "RecordTable", index: int):
+        self.table = table
+        self.index = index
+
+    @property
+    def full_name(self) -> str:
+        return self.table.full_name(self.index)
+
+    @property
+    def path(self) -> str:
+        return self.full_name.rpartition("/")[0]
+
+    @property
+    def name(self) -> str:
+        return self.full_name.rpartition("/")[2]
+
+    @property
+    def size(self) -> int:
+        return self.table.sizes[self.index]
+
+    @property
+    def modified(self) -> datetime | None:
+        return RecordTable.to_datetime(self.table.modified[self.index])
+
+    created = modified
+
+    @property
+    def md5(self) -> str | None:
+        return self.table.digest(self.table.md5, self.index, RecordTable.MD5_SIZE)
+
+    @property
+    def sha256(self) -> str | None:
+        return self.table.digest(self.table.sha256, self.index, RecordTable.SHA256_SIZE)
+
+    def __hash__(self):
+        return hash((self.md5, self.sha256, self.size))
+
+    def __eq__(self, other):
+        # Строки, как и файлы в цепочках синхронизации, сравниваются по содержимому
+        if not isinstance(other, (FileRow, FileInfo)):
+            return NotImplemented
+        return (self.md5, self.sha256, self.size) == (other.md5, other.sha256, other.size)
+
+    def __repr__(self):
+        return (
+            f"FileRow(full_name={self.full_name!r}, size={self.size!r}, "
+            f"modified={self.modified!r}, md5={self.md5!r}, sha256={self.sha256!r})"
+        )
+
+
+class RecordTable:
+    """
+    Колоночное хранилище списка файлов слоя.
+    full_name хранятся одним блоком utf-8 со смещениями, size и modified (микросекунды от эпохи) -
+    в массивах int64, md5/sha256 - в байтовых колонках фиксированной ширины.
+    Итерация и индексация возвращают легковесные FileRow
+    """
+
+    MD5_SIZE = 16
+    SHA256_SIZE = 32
+    NO_TIME = -(2**63)
+    "Значение колонки modified для файлов без даты модификации"
+
+    def __init__(self, files: ty.Iterable[FileInfo] = ()):
+        self.names = bytearray()
+        self.offsets = array("q", [0])
+        self.sizes = array("q")
+        self.modified = array("q")
+        self.md5 = bytearray()
+        self.sha256 = bytearray()
+        self._index: dict[str, int] | None = None
+        self.extend(files)
+
+    @classmethod
+    def to_epoch(cls, value: datetime | None) -> int:
+        if not isinstance(value, datetime):
+            return cls.NO_TIME
+        return round(value.timestamp() * 1_000_000)
+
+    @classmethod
+    def to_datetime(cls, value: int) -> datetime | None:
+        if value == cls.NO_TIME:
+            return None
+        return datetime.fromtimestamp(value / 1_000_000, timezone.utc)
+
+    @staticmethod
+    def digest(column: bytearray, index: int, width: int) -> str | None:
+        value = column[index * width : (index + 1) * width]
+        if not any(value):
+            return None
+        return value.hex()
+
+    def append(self, file: FileInfo):
+        """
+        Добавить файл в таблицу
+        Parameters
+        ----------
+        file : FileInfo или FileRow
+        """
+        if file.is_folder:
+            raise ValueError(f"'{file.full_name}' is folder")
+        digests = []
+        for column, value, width in (
+            (self.md5, file.md5, self.MD5_SIZE),
+            (self.sha256, file.sha256, self.SHA256_SIZE),
+        ):
+            digest = bytes.fromhex(value) if isinstance(value, str) else bytes(width)
+            if len(digest) != width:
+                # Колонка фиксированной ширины: хэш другой длины сдвинул бы все следующие строки
+                raise ValueError(f"'{file.full_name}': {width}-byte digest expected, got {value!r}")
+            digests.append((column, digest))
+        self.names += file.full_name.encode()
+        self.offsets.append(len(self.names))
+        self.sizes.append(file.size if isinstance(file.size, int) else -1)
+        self.modified.append(self.to_epoch(file.modified))
+        for column, digest in digests:
+            column += digest
+        if self._index is not None:
+            self._index[file.full_name] = len(self) - 1
+
+    def extend(self, files: ty.Iterable[FileInfo]):
+        for file in files:
+            self.append(file)
+
+    def full_name(self, index: int) -> str:
+        return self.names[self.offsets[index] : self.offsets[index + 1]].decode()
+
+    def find(self, full_name: str) -> int | None:
+        """
+        Номер строки файла с полным именем full_name, индекс по именам строится при первом поиске
+        """
+        if self._index is None:
+            self._index = {self.full_name(index): index for index in range(len(self))}
+        return self._index.get(full_name)
+
+    def get(self, full_name: str) -> FileRow | None:
+        if (index := self.find(full_name)) is None:
+            return None
+        return FileRow(self, index)
+
+    def columns(self) -> dict[str, ty.Any]:
+        """
+        Колонки таблицы в виде массивов NumPy (без копирования) для векторных сравнений
+        """
+        if np is None:
+            raise ImportError("numpy is required for RecordTable.columns()")
+        return {
+            "offsets": np.frombuffer(self.offsets, dtype=np.int64),
+            "size": np.frombuffer(self.sizes, dtype=np.int64),
+            "modified": np.frombuffer(self.modified, dtype=np.int64),
+            "md5": np.frombuffer(self.md5, dtype=f"S{self.MD5_SIZE}"),
+            "sha256": np.frombuffer(self.sha256, dtype=f"S{self.SHA256_SIZE}"),
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Объем данных колонок в байтах
+        """
+        return sum(
+            len(column) * getattr(column, "itemsize", 1)
+            for column in (self.names, self.offsets, self.sizes, self.modified, self.md5, self.sha256)
+        )
+
+    def save(self, path: str, **meta):
+        """
+        Сохранить таблицу в файл: строка заголовка json, далее колонки
+        Parameters
+        ----------
+        path : Путь к файлу, запись атомарная (через временный файл)
+        meta : Дополнительные данные, сохраняемые в заголовке
+        """
+        header = {"rows": len(self), "names": len(self.names), "meta": meta}
+        with open(temp_path := f"{path}.tmp", "wb") as file:
+            file.write(json.dumps(header).encode() + b"\n")
+            for column in (self.offsets, self.sizes, self.modified):
+                column.tofile(file)
+            for column in (self.names, self.md5, self.sha256):
+                file.write(column)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> tuple["RecordTable", dict]:
+        """
+        Загрузить таблицу, сохраненную save
+        Returns
+        -------
+        (таблица, дополнительные данные заголовка)
+        """
+        table = cls()
+        with open(path, "rb") as file:
+            header = json.loads(file.readline())
+            rows = header["rows"]
+            table.offsets = array("q")
+            table.offsets.fromfile(file, rows + 1)
+            table.sizes.fromfile(file, rows)
+            table.modified.fromfile(file, rows)
+            table.names = bytearray(file.read(header["names"]))
+            table.md5 = bytearray(file.read(rows * cls.MD5_SIZE))
+            table.sha256 = bytearray(file.read(rows * cls.SHA256_SIZE))
+        return table, header["meta"]
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, index: int) -> FileRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return FileRow(self, index)
+
+    def __iter__(self) -> ty.Iterator[FileRow]:
+        for index in range(len(self)):
+            yield FileRow(self, index)
+
+    def __contains__(self, full_name: str) -> bool:
+        return self.find(full_name) is not None
+
+
 # def walk(path: str) -> ty.Iterable[Resource, ty.Iterable[Resource], ty.Iterable[Resource]]:
 #     """
 #
@@ -132,12 +389,47 @@ class BaseFS:
     def cp(self, path: str, target: str, overwrite: bool = False):
         ...
 
-    def ls(self, path_to_folder: str = None) -> ty.Iterable[FileInfo]:
+    @abstractmethod
+    def mv(self, path: str, target: str, overwrite: bool = False):
+        ...
+
+    def link(self, path: str, target: str):
+        """
+        Создать в target ссылку на path, если FS поддерживает ссылки
+        """
+        raise NotImplementedError
+
+    def open_read(self, path: str, offset: int = 0) -> ty.BinaryIO:
+        """
+        Поток чтения файла с позиции offset, если FS поддерживает потоковую передачу
+        """
+        raise NotImplementedError
+
+    def open_write(self, path: str, offset: int = 0) -> ty.BinaryIO:
+        """
+        Поток записи файла: offset=0 - файл перезаписывается, иначе данные дописываются с позиции offset
+        """
+        raise NotImplementedError
+
+    def set_modified(self, path: str, modified: datetime):
+        """
+        Установить время изменения файла, если FS это позволяет
+        """
+        raise NotImplementedError
+
+    def ls(self, path_to_folder: str = None) -> ty.Iterable[FileInfo] | RecordTable:
         ...
 
     def get_hash(self, file: str) -> HashOfFile:
         ...
 
+    def get_hashes(self, files: ty.Iterable[str]) -> ty.Iterator[tuple[str, HashOfFile]]:
+        """
+        Хэши списка файлов, пары (полное имя, хэш)
+        """
+        for file in files:
+            yield file, self.get_hash(file)
+
     def exist(self, path: str) -> bool:
         ...
 
@@ -163,7 +455,31 @@ class RemoteFS(Protocol):
 
 
 @runtime_checkable
-class LocalExtFS:
+class ChangeFeedFS(Protocol):
+    """
+    FS, сообщающая об изменениях с заданной ревизии (например, лента "последние загруженные" облака)
+    """
+
+    @abstractmethod
+    def revision(self) -> str:
+        """
+        Текущая ревизия FS
+        """
+
+    @abstractmethod
+    def changes_since(
+        self, revision: str
+    ) -> tuple[str, ty.Iterable[FileInfo], ty.Iterable[str]]:
+        """
+        Изменения FS после ревизии revision
+        Returns
+        -------
+        (новая ревизия, добавленные и измененные файлы, полные имена удаленных файлов)
+        """
+
+
+@runtime_checkable
+class LocalExtFS(Protocol):
     ...
 
 
@@ -180,8 +496,193 @@ class TempFS(BaseFS):
         raise NotImplemented
 
 
+@dataclasses.dataclass
 class LocalFS(BaseFS, LocalExtFS):
-    ...
+    root: str
+    "Каталог локальной ФС, полные имена файлов отсчитываются от него"
+    hash_engine: HashEngine = dataclasses.field(
+        default_factory=HashEngine, repr=False, compare=False
+    )
+    hash_cache: HashCache | None = dataclasses.field(
+        default=None, repr=False, compare=False
+    )
+    "Кэш хэшей, если задан - хэши неизменившихся файлов не пересчитываются"
+    walk_workers: int = 8
+    "Количество потоков обхода каталогов"
+
+    def os_path(self, path: str) -> str:
+        """
+        Путь в ОС по полному имени файла
+        """
+        return os.path.join(self.root, path.lstrip("/"))
+
+    @staticmethod
+    def _resource(full_name: str, stat: os.stat_result, is_folder: bool) -> Resource:
+        path, _, name = full_name.rpartition("/")
+        created = datetime.fromtimestamp(stat.st_ctime, timezone.utc)
+        modified = datetime.fromtimestamp(stat.st_mtime_ns / 1e9, timezone.utc)
+        if is_folder:
+            return FolderInfo(True, path or "/", name, full_name, created, modified)
+        return FileInfo(
+            False, path or "/", name, full_name, created, modified, stat.st_size, None, None
+        )
+
+    def _scan(
+        self, folder: str, onerror: ty.Callable[[OSError], None] = None
+    ) -> tuple[list[FileInfo], list[str]]:
+        """
+        Файлы и подкаталоги каталога folder. Используется stat из DirEntry
+        (в Windows он уже получен при чтении каталога, в POSIX - один системный вызов на файл).
+        Нечитаемый каталог пропускается (см. walk), файл, удаленный во время чтения каталога, - тоже
+        """
+        files, folders = [], []
+        prefix = folder.rstrip("/") + "/"
+        try:
+            with os.scandir(self.os_path(folder)) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.append(prefix + entry.name)
+                        elif entry.is_file():
+                            files.append(self._resource(prefix + entry.name, entry.stat(), False))
+                    except OSError:
+                        continue
+        except OSError as error:
+            if onerror is not None:
+                onerror(error)
+        return files, folders
+
+    def walk(
+        self, path_to_folder: str = "/", onerror: ty.Callable[[OSError], None] = None
+    ) -> ty.Iterator[FileInfo]:
+        """
+        Рекурсивный обход каталога, подкаталоги читаются параллельно в пуле потоков.
+        Файлы выдаются по мере чтения каталогов, порядок не определен
+
+        Parameters
+        ----------
+        onerror : Вызывается с ошибкой чтения каталога (нет прав, каталог удален во время обхода),
+            как в os.walk; каталог пропускается, обход продолжается
+        """
+        with ThreadPoolExecutor(self.walk_workers, thread_name_prefix="walk") as pool:
+            pending: set[Future] = {pool.submit(self._scan, path_to_folder, onerror)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files, folders = future.result()
+                        pending |= {pool.submit(self._scan, folder, onerror) for folder in folders}
+                        yield from files
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def ls(self, path_to_folder: str = None) -> ty.Iterator[FileInfo]:
+        return self.walk(path_to_folder or "/")
+
+    def get(self, path: str) -> FileInfo | FolderInfo | None:
+        try:
+            stat = os.stat(self.os_path(path))
+        except FileNotFoundError:
+            return None
+        return self._resource("/" + path.strip("/"), stat, os.path.isdir(self.os_path(path)))
+
+    def exist(self, path: str) -> bool:
+        return os.path.exists(self.os_path(path))
+
+    def touch(self, path_to_file: str):
+        with open(self.os_path(path_to_file), "ab"):
+            ...
+
+    def mkdir(self, path_to_folder: str):
+        os.makedirs(self.os_path(path_to_folder), exist_ok=True)
+
+    def rm(self, path: str):
+        if os.path.isdir(os_path := self.os_path(path)):
+            shutil.rmtree(os_path)
+        else:
+            os.remove(os_path)
+
+    def cp(self, path: str, target: str, overwrite: bool = False):
+        if not overwrite and self.exist(target):
+            raise FileExistsError(target)
+        os.makedirs(os.path.dirname(self.os_path(target)), exist_ok=True)
+        if os.path.isdir(os_path := self.os_path(path)):
+            shutil.copytree(os_path, self.os_path(target), dirs_exist_ok=overwrite)
+        else:
+            shutil.copy2(os_path, self.os_path(target))
+
+    def mv(self, path: str, target: str, overwrite: bool = False):
+        if not overwrite and self.exist(target):
+            raise FileExistsError(target)
+        os.makedirs(os.path.dirname(self.os_path(target)), exist_ok=True)
+        os.replace(self.os_path(path), self.os_path(target))
+
+    def link(self, path: str, target: str):
+        os.makedirs(os.path.dirname(self.os_path(target)), exist_ok=True)
+        os.link(self.os_path(path), self.os_path(target))
+
+    def open_read(self, path: str, offset: int = 0) -> ty.BinaryIO:
+        file = open(self.os_path(path), "rb")
+        file.seek(offset)
+        return file
+
+    def open_write(self, path: str, offset: int = 0) -> ty.BinaryIO:
+        os.makedirs(os.path.dirname(os_path := self.os_path(path)), exist_ok=True)
+        if not offset:
+            return open(os_path, "wb")
+        file = open(os_path, "r+b")
+        file.seek(offset)
+        file.truncate()
+        return file
+
+    def set_modified(self, path: str, modified: datetime):
+        os_path = self.os_path(path)
+        os.utime(os_path, (os.stat(os_path).st_atime, modified.timestamp()))
+
+    def get_hash(self, file: str) -> HashOfFile:
+        os_path = self.os_path(file)
+        if self.hash_cache is None:
+            return HashOfFile(*self.hash_engine.hash_file(os_path))
+        stat = os.stat(os_path)
+        if (digests := self.hash_cache.lookup(stat)) is None:
+            digests = self.hash_engine.hash_file(os_path)
+            self.hash_cache.store(stat, digests)
+            # Одиночный хэш (проверка переданного файла) фиксируется сразу: закрытия кэша может не быть
+            self.hash_cache.flush()
+        return HashOfFile(*digests)
+
+    def get_hashes(self, files: ty.Iterable[str]) -> ty.Iterator[tuple[str, HashOfFile]]:
+        if self.hash_cache is None:
+            for file, digests in self.hash_engine.hash_files(files, self.os_path):
+                yield file, HashOfFile(*digests)
+            return
+        uncached: list[tuple[str, os.stat_result]] = []
+        for file in files:
+            stat = os.stat(self.os_path(file))
+            if (digests := self.hash_cache.lookup(stat)) is None:
+                uncached.append((file, stat))
+            else:
+                yield file, HashOfFile(*digests)
+        for (file, stat), digests in self.hash_engine.hash_files(
+            uncached, lambda item: self.os_path(item[0])
+        ):
+            self.hash_cache.store(stat, digests)
+            yield file, HashOfFile(*digests)
+        self.hash_cache.flush()
+
+    def close(self):
+        """
+        Закрыть кэш хэшей, несохраненные записи фиксируются
+        """
+        if self.hash_cache is not None:
+            self.hash_cache.close()
+
+    def __enter__(self) -> "LocalFS":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 #
@@ -270,25 +771,422 @@ class LocalFS(BaseFS, LocalExtFS):
 # MountPoint: ty.TypeAlias = str
 
 
+@dataclasses.dataclass
+class LayerDelta:
+    """
+    Изменения слоя относительно его снимка после предыдущей синхронизации
+    """
+
+    added: list[FileInfo] = dataclasses.field(default_factory=list)
+    changed: list[FileInfo] = dataclasses.field(default_factory=list)
+    removed: list[str] = dataclasses.field(default_factory=list)
+    revision: str | None = None
+    "Ревизия FS, на которую получены изменения"
+
+    @property
+    def paths(self) -> set[str]:
+        return (
+            {file.full_name for file in self.added}
+            | {file.full_name for file in self.changed}
+            | set(self.removed)
+        )
+
+    @staticmethod
+    def _differs(file: FileInfo, table: RecordTable, index: int) -> bool:
+        if file.size != table.sizes[index]:
+            return True
+        if RecordTable.to_epoch(file.modified) != table.modified[index]:
+            return True
+        md5 = table.digest(table.md5, index, RecordTable.MD5_SIZE)
+        return isinstance(file.md5, str) and md5 is not None and file.md5 != md5
+
+    @classmethod
+    def between(
+        cls, table: RecordTable, listing: ty.Iterable[FileInfo]
+    ) -> "LayerDelta":
+        """
+        Изменения слоя по текущему листингу (для локальной FS - обходу с stat) и снимку table.
+        Файл считается измененным, если изменились размер или время модификации,
+        либо известны оба хэша, и они не совпадают
+        """
+        delta = cls()
+        seen = set()
+        for file in listing:
+            if file.is_folder:
+                continue
+            seen.add(file.full_name)
+            if (index := table.find(file.full_name)) is None:
+                delta.added.append(file)
+            elif cls._differs(file, table, index):
+                delta.changed.append(file)
+        delta.removed = [
+            full_name
+            for index in range(len(table))
+            if (full_name := table.full_name(index)) not in seen
+        ]
+        return delta
+
+
+@dataclasses.dataclass
+class LayerStats:
+    """
+    Измеренные характеристики чтения из слоя, хранятся в FSLayer.params["stats"].
+    Скорость, задержка и доступность уточняются по каждой передаче (экспоненциальное сглаживание),
+    стоимость задается настройкой слоя
+    """
+
+    throughput: float = 10 * 2**20
+    "Скорость передачи, байт/с"
+    latency: float = 0.1
+    "Задержка начала передачи, с"
+    cost_per_gb: float = 0.0
+    "Стоимость передачи гигабайта из слоя"
+    availability: float = 1.0
+    "Доля успешных передач"
+    transfers: int = 0
+    "Количество учтенных передач"
+
+    SMOOTHING = 0.2
+    "Вес последней передачи"
+
+    @classmethod
+    def of(cls, layer: "FSLayer") -> "LayerStats":
+        return cls(**layer.params.get("stats", {}))
+
+    def store(self, layer: "FSLayer"):
+        layer.params["stats"] = dataclasses.asdict(self)
+
+    def learn(self, size: int, seconds: float, ok: bool = True):
+        """
+        Учесть передачу size байт за seconds секунд
+        """
+        alpha = 1.0 if self.transfers == 0 else self.SMOOTHING
+        self.availability += alpha * ((1.0 if ok else 0.0) - self.availability)
+        self.transfers += 1
+        if not ok:
+            return
+        # Малые файлы характеризуют задержку, большие - скорость
+        if size < 2**20:
+            self.latency += alpha * (seconds - self.latency)
+        else:
+            throughput = size / max(seconds - self.latency, seconds / 2, 1e-6)
+            self.throughput += alpha * (throughput - self.throughput)
+
+    def estimate(self, size: int) -> tuple[float, float]:
+        """
+        Ожидаемые (время, стоимость) передачи size байт из слоя, с учетом повторов при сбоях
+        """
+        seconds = (self.latency + size / self.throughput) / max(self.availability, 1e-3)
+        return seconds, size / 2**30 * self.cost_per_gb
+
+
+@dataclasses.dataclass
+class SourceEstimate:
+    """
+    Оценка слоя-источника для копирования
+    """
+
+    layer: str
+    "Ключ слоя"
+    seconds: float
+    cost: float
+    availability: float
+    intra: bool
+    "Источник и цель - одна FS: копирование внутри хранилища, без передачи данных"
+
+
+@dataclasses.dataclass
+class SourceChoice:
+    """
+    Выбор источника для копирования файла в слой: кандидаты в порядке предпочтения, первый - выбранный
+    """
+
+    full_name: str
+    size: int
+    target: str
+    "Ключ слоя назначения"
+    strategy: str
+    candidates: list[SourceEstimate]
+
+    @property
+    def chosen(self) -> str | None:
+        return self.candidates[0].layer if self.candidates else None
+
+    def as_dict(self) -> dict:
+        return dataclasses.asdict(self) | {"chosen": self.chosen}
+
+
+STRATEGIES = ("fastest", "inexpensive")
+
+
+def rank_sources(
+    sources: ty.Iterable["FSLayer"],
+    target: "FSLayer",
+    size: int,
+    strategy: str = "fastest",
+) -> list[SourceEstimate]:
+    """
+    Упорядочить слои-источники для копирования size байт в слой target по стратегии.
+    Копирование внутри одной FS всегда предпочтительнее (п.4 алгоритма синхронизации)
+
+    Parameters
+    ----------
+    strategy : "fastest" - по ожидаемому времени, затем стоимости,
+        "inexpensive" - по стоимости, затем времени
+
+    Returns
+    -------
+    Оценки источников, лучший первым
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия {strategy}, допустимы {STRATEGIES}")
+    estimates = []
+    for layer in sources:
+        stats = LayerStats.of(layer)
+        intra = layer.fs is target.fs
+        seconds, cost = stats.estimate(0 if intra else size)
+        estimates.append(SourceEstimate(layer.key, seconds, cost, stats.availability, intra))
+    if strategy == "fastest":
+        key = lambda item: (not item.intra, item.seconds, item.cost)
+    else:
+        key = lambda item: (not item.intra, item.cost, item.seconds)
+    return sorted(estimates, key=key)
+
+
 @dataclasses.dataclass
 class FSLayer(BaseFS):
     key: str
     fs: BaseFS
     params: dict
+    _index: dict[str, FileInfo] | RecordTable | None = dataclasses.field(
+        default=None, init=False, repr=False, compare=False
+    )
+    "Индекс файлов слоя по полному имени, строится по первому полному листингу"
+    _overlay: dict[str, FileInfo | None] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    "Изменения поверх индекса: полное имя - новое описание файла, None - файл удален"
+
+    CHUNK_SIZE = 4 * 2**20
+    "Размер блока при передаче файла между слоями"
 
     # def __hash__(self):
     #     return hash(self.key)
 
+    def learn_transfer(self, size: int, seconds: float, ok: bool = True):
+        """
+        Учесть в характеристиках слоя (params["stats"]) передачу из него size байт за seconds секунд
+        """
+        stats = LayerStats.of(self)
+        stats.learn(size, seconds, ok)
+        stats.store(self)
+
+    def _files(self) -> dict[str, FileInfo] | RecordTable:
+        if self._index is None:
+            listing = self.fs.ls()
+            if isinstance(listing, RecordTable):
+                self._index = listing
+            else:
+                self._index = {file.full_name: file for file in listing}
+        return self._index
+
+    def _update(self, path: str):
+        if self._index is None:
+            return
+        self._overlay[path] = self.fs.get(path)
+
+    def _merged(self) -> ty.Iterator[FileInfo | FileRow]:
+        overlay = self._overlay
+        for file in self.ls_indexed():
+            if file.full_name not in overlay:
+                yield file
+        for file in overlay.values():
+            if file is not None:
+                yield file
+
+    def ls_indexed(self) -> ty.Iterable[FileInfo] | RecordTable:
+        """
+        Файлы индекса без учета изменений
+        """
+        if isinstance(files := self._files(), RecordTable):
+            return files
+        return files.values()
+
+    def refresh(self):
+        """
+        Сбросить индекс, следующее обращение перечитает слой
+        """
+        self._index = None
+        self._overlay = {}
+
+    def load_snapshot(self, table: RecordTable, delta: "LayerDelta" = None):
+        """
+        Использовать в качестве индекса снимок слоя с изменениями delta, не перечитывая слой
+        """
+        self._index = table
+        self._overlay = {}
+        if delta is not None:
+            self._overlay.update(dict.fromkeys(delta.removed))
+            self._overlay.update((file.full_name, file) for file in delta.added)
+            self._overlay.update((file.full_name, file) for file in delta.changed)
+
+    def ls(self, path_to_folder: str = None) -> ty.Iterable[FileInfo] | RecordTable:
+        if path_to_folder is not None:
+            return self.fs.ls(path_to_folder)
+        if not self._overlay:
+            return self.ls_indexed()
+        return self._merged()
+
+    def snapshot(self) -> RecordTable:
+        """
+        Список файлов слоя в колоночном виде
+        """
+        listing = self.ls()
+        if isinstance(listing, RecordTable):
+            return listing
+        return RecordTable(file for file in listing if not file.is_folder)
+
+    def sorted_files(self, paths: ty.Iterable[str] = None) -> ty.Iterator[FileInfo | FileRow]:
+        """
+        Файлы слоя (без папок) в порядке возрастания полных имен, с учетом изменений
+
+        Parameters
+        ----------
+        paths : Ограничить файлами с этими полными именами, None - все файлы слоя
+        """
+        if paths is not None:
+            return (file for full_name in sorted(paths) if (file := self.get(full_name)))
+        listing = self.ls()
+        if isinstance(listing, RecordTable):
+            order = sorted(range(len(listing)), key=listing.full_name)
+            return (listing[index] for index in order)
+        return iter(
+            sorted(
+                (file for file in listing if not file.is_folder),
+                key=lambda file: file.full_name,
+            )
+        )
+
+    def touch(self, path_to_file: str):
+        self.fs.touch(path_to_file)
+        self._update(path_to_file)
+
+    def mkdir(self, path_to_folder: str):
+        self.fs.mkdir(path_to_folder)
+        self._update(path_to_folder)
+
+    def rm(self, path: str):
+        self.fs.rm(path)
+        if self._index is None:
+            return
+        removed = self.find_file(path)
+        self._overlay[path] = None
+        if removed is None or removed.is_folder:
+            prefix = path.rstrip("/") + "/"
+            for full_name in [
+                file.full_name for file in self.ls() if file.full_name.startswith(prefix)
+            ]:
+                self._overlay[full_name] = None
+
+    def cp(self, path: str, target: str, overwrite: bool = False):
+        self.fs.cp(path, target, overwrite=overwrite)
+        if (source := self.find_file(path)) is not None and source.is_folder:
+            # Скопировано дерево, проще перечитать слой
+            self.refresh()
+        else:
+            self._update(target)
+
+    def mv(self, path: str, target: str, overwrite: bool = False):
+        self.fs.mv(path, target, overwrite=overwrite)
+        if (source := self.find_file(path)) is not None and source.is_folder:
+            self.refresh()
+        else:
+            self._update(path)
+            self._update(target)
+
+    def link(self, path: str, target: str):
+        self.fs.link(path, target)
+        self._update(target)
+
+    def open_read(self, path: str, offset: int = 0) -> ty.BinaryIO:
+        return self.fs.open_read(path, offset)
+
+    def receive(
+        self,
+        path: str,
+        stream: ty.BinaryIO,
+        offset: int = 0,
+        modified: datetime = None,
+        progress: ty.Callable[[int], None] = None,
+    ) -> int:
+        """
+        Записать в файл path слоя данные из потока stream
+
+        Parameters
+        ----------
+        offset : Позиция в файле, с которой пишутся данные (продолжение прерванной передачи)
+        modified : Время изменения файла-источника, сохраняется, если FS это позволяет
+        progress : Вызывается после каждого записанного блока с позицией в файле
+
+        Returns
+        -------
+        Размер записанного файла
+        """
+        with self.fs.open_write(path, offset) as file:
+            while chunk := stream.read(self.CHUNK_SIZE):
+                file.write(chunk)
+                offset += len(chunk)
+                if progress is not None:
+                    # Позиция сообщается, когда данные уже переданы FS
+                    file.flush()
+                    progress(offset)
+        if modified is not None:
+            try:
+                self.fs.set_modified(path, modified)
+            except NotImplementedError:
+                ...
+        self._update(path)
+        return offset
+
+    def remember(self, file: FileInfo):
+        """
+        Запомнить описание файла поверх индекса, например, с хэшами, известными по файлу-источнику
+        """
+        if self._index is not None:
+            self._overlay[file.full_name] = file
+
+    def fill_hashes(self):
+        """
+        Запросить у FS недостающие хэши файлов слоя и запомнить их (см. remember):
+        без хэшей файл не найти по содержимому (переименование, копия внутри слоя)
+        """
+        unhashed = {
+            file.full_name: file
+            for file in self.ls()
+            if not file.is_folder
+            and HashOfFile.of(file) is None
+            and dataclasses.is_dataclass(file)
+        }
+        for full_name, content in self.fs.get_hashes(unhashed):
+            if content is not None:
+                self.remember(
+                    dataclasses.replace(
+                        unhashed[full_name], md5=content.md5, sha256=content.sha256
+                    )
+                )
+
+    def exist(self, path: str) -> bool:
+        return self.find_file(path) is not None
+
+    def get(self, path: str) -> FileInfo | FileRow | None:
+        return self.find_file(path)
+
     # @classmethod
-    def find_file(self, full_filename: str) -> FileInfo | None:
-        return next(
-            (
-                file_on_layer
-                for file_on_layer in self.ls()
-                if file_on_layer.full_name == full_filename
-            ),
-            None,
-        )  # Поиск файла на слое
+    def find_file(self, full_filename: str) -> FileInfo | FileRow | None:
+        files = self._files()
+        if full_filename in self._overlay:
+            return self._overlay[full_filename]
+        return files.get(full_filename)  # Поиск файла на слое
 
 
 # K = ty.TypeVar("K")
@@ -316,18 +1214,189 @@ class FileOnLayer:
     fs: FSLayer
 
 
+class HashIndex(dict[HashOfFile, list[FileOnLayer]]):
+    """
+    Индекс содержимого файлов всех слоев: хэш файла - список файлов с этим хэшем на слоях.
+    Изменения индекса потокобезопасны: узлы синхронизируются параллельно
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.RLock()
+        self._locations: dict[tuple[int, str], HashOfFile] = {}
+        """
+        (id слоя, полное имя файла) - хэш, для инкрементального обновления.
+        Слои разных узлов могут иметь одинаковые ключи, поэтому слой определяется объектом
+        """
+        self._layers: set[int] = set()
+        "id проиндексированных слоев"
+
+    def indexed(self, layer: FSLayer) -> bool:
+        return id(layer) in self._layers
+
+    def add(self, file: FileInfo, layer: FSLayer):
+        with self.lock:
+            if file.is_folder or (content := HashOfFile.of(file)) is None:
+                return
+            self.discard(file.full_name, layer)
+            self.setdefault(content, []).append(FileOnLayer(file, layer))
+            self._locations[(id(layer), file.full_name)] = content
+
+    def discard(self, full_name: str, layer: FSLayer):
+        with self.lock:
+            if (content := self._locations.pop((id(layer), full_name), None)) is None:
+                return
+            files = self[content]
+            files[:] = [
+                item
+                for item in files
+                if item.fs is not layer or item.resource.full_name != full_name
+            ]
+            if not files:
+                del self[content]
+
+    def add_layer(self, layer: FSLayer):
+        """
+        Проиндексировать (заново) все файлы слоя
+        """
+        listing = layer.ls()
+        with self.lock:
+            self.remove_layer(layer)
+            self._layers.add(id(layer))
+            for file in listing:
+                self.add(file, layer)
+
+    def apply_delta(self, layer: FSLayer, delta: LayerDelta):
+        """
+        Обновить индекс слоя по его изменениям
+        """
+        with self.lock:
+            for full_name in delta.removed:
+                self.discard(full_name, layer)
+            for file in delta.added + delta.changed:
+                self.discard(file.full_name, layer)
+                self.add(file, layer)
+
+    def remove_layer(self, layer: FSLayer):
+        with self.lock:
+            self._layers.discard(id(layer))
+            for key, full_name in [loc for loc in self._locations if loc[0] == id(layer)]:
+                self.discard(full_name, layer)
+
+    def find(self, content: HashOfFile, layer: FSLayer = None) -> list[FileOnLayer]:
+        """
+        Файлы с хэшем content, на слое layer или на всех слоях
+        """
+        with self.lock:
+            return [
+                item for item in self.get(content, ()) if layer is None or item.fs is layer
+            ]
+
+
 class FSLayersPool(dict[str, FSLayer]):
     def attach(self, fs: FSLayer):
         self[fs.key] = fs
 
     def find_file(self, full_pathname: str) -> list[FileOnLayer]:
-        ...
+        """
+        Файл с полным именем full_pathname на всех слоях пула, где он есть
+        """
+        return [
+            FileOnLayer(file, layer)
+            for layer in self.values()
+            if (file := layer.find_file(full_pathname)) is not None
+        ]
 
 
 class CopyError(Exception):
     ...
 
 
+@dataclasses.dataclass(slots=True)
+class Chain:
+    """
+    Цепочка файлов с одним полным именем на слоях узла
+    """
+
+    full_name: str
+    files: list[FileInfo | FileRow | None]
+    "Позиция - номер слоя в Node.layers, None - файла в слое нет"
+    equal: bool
+    "Файл есть на всех слоях, и хэши всех файлов совпадают"
+
+    @property
+    def present(self) -> list[bool]:
+        return [file is not None for file in self.files]
+
+    @property
+    def count(self) -> int:
+        "Количество слоев, где файл есть"
+        return sum(file is not None for file in self.files)
+
+
+def merge_chains(
+    streams: ty.Sequence[ty.Iterable[FileInfo | FileRow]],
+) -> ty.Iterator[Chain]:
+    """
+    Слияние отсортированных по полному имени листингов слоев (k-way merge) в цепочки,
+    по одной на каждое полное имя. Кроме самих потоков, в памяти только по одному файлу
+    на слой, время O(всего файлов * log слоев)
+
+    Parameters
+    ----------
+    streams : Файлы каждого слоя в порядке возрастания полных имен
+
+    Returns
+    -------
+    Цепочки в порядке возрастания полных имен
+    """
+
+    def keyed(num: int, stream: ty.Iterable[FileInfo | FileRow]):
+        # Номер слоя вторым элементом: файлы с одинаковым именем между собой не сравниваются
+        return ((file.full_name, num, file) for file in stream)
+
+    merged = heapq.merge(*(keyed(num, stream) for num, stream in enumerate(streams)))
+    for full_name, group in itertools.groupby(merged, key=lambda item: item[0]):
+        files = [None] * len(streams)
+        for _, num, file in group:
+            files[num] = file
+        content = HashOfFile.of(files[0]) if files[0] is not None else None
+        equal = content is not None and all(
+            file is not None and HashOfFile.of(file) == content for file in files[1:]
+        )
+        yield Chain(full_name, files, equal)
+
+
+def same_content(file: FileInfo | FileRow, other: FileInfo | FileRow) -> bool:
+    """
+    Файлы одинаковы: совпадают хэши, если же хэш одного из файлов неизвестен - размер и время изменения
+    """
+    content, other_content = HashOfFile.of(file), HashOfFile.of(other)
+    if content is not None and other_content is not None:
+        return content == other_content
+    return file.size == other.size and RecordTable.to_epoch(
+        file.modified
+    ) == RecordTable.to_epoch(other.modified)
+
+
+def file_version(file: FileInfo | FileRow) -> str:
+    """
+    Версия файла для журнала выполнения плана: время изменения и хэш, если он известен
+    """
+    content = HashOfFile.of(file)
+    return f"{RecordTable.to_epoch(file.modified)}:{content.md5 if content else ''}"
+
+
+def same_version(file: FileInfo | FileRow, version: str) -> bool:
+    """
+    Файл той же версии, что и version (см. file_version): хэши сравниваются, если известны обоим.
+    Исполнитель плана может не знать хэшей, посчитанных при планировании
+    """
+    modified, _, md5 = version.partition(":")
+    file_modified, _, file_md5 = file_version(file).partition(":")
+    return modified == file_modified and (not md5 or not file_md5 or md5 == file_md5)
+
+
 @dataclasses.dataclass
 class Node:
     # layers: dict[str, BaseFS] = {}
@@ -338,6 +1407,43 @@ class Node:
     mode: ty.Literal["mirror", "union"] = "mirror"
 
 
+@dataclasses.dataclass
+class NodeReport:
+    """
+    Ход и продолжительность синхронизации узла
+    """
+
+    node: str
+    stage: str = "pending"
+    "Текущий этап: pending, listing, chains, plan, copy, snapshots, done, failed"
+    chains: int = 0
+    "Неуспешных цепочек"
+    processed: int = 0
+    "Обработано цепочек"
+    manual: int = 0
+    "Цепочек, требующих ручного разрешения"
+    operations: list[Operation] = dataclasses.field(default_factory=list)
+    "План синхронизации узла"
+    failed: int = 0
+    "Невыполненных операций плана, кроме конфликтов"
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    "Этап - продолжительность, с"
+    choices: list[SourceChoice] = dataclasses.field(default_factory=list)
+    "Выбор источников копирования, для аудита"
+    error: BaseException | None = None
+    _entered: float = dataclasses.field(default=0.0, repr=False)
+
+    @property
+    def elapsed(self) -> float:
+        return sum(self.timings.values())
+
+    def enter(self, stage: str):
+        now = time.perf_counter()
+        if self.stage != "pending":
+            self.timings[self.stage] = now - self._entered
+        self.stage, self._entered = stage, now
+
+
 @dataclasses.dataclass
 class UnionFS:
     # layers: dict[str, BaseFS] = {}
@@ -346,6 +1452,24 @@ class UnionFS:
     # mode: ty.Literal["mirror", "union"] = "mirror"
     root: str
     nodes: list[Node]
+    state_dir: str | None = None
+    "Каталог снимков слоев для инкрементальной синхронизации, None - синхронизировать полностью"
+    workers: int = 4
+    "Количество одновременно синхронизируемых узлов"
+    strategy: str = "fastest"
+    "Стратегия выбора источника копирования (см. rank_sources), слой может задать свою в params['strategy']"
+    progress: ty.Callable[["NodeReport"], None] | None = dataclasses.field(
+        default=None, repr=False, compare=False
+    )
+    "Вызывается при переходе узла к следующему этапу синхронизации"
+    _layer_slots: dict[int, threading.BoundedSemaphore] = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    "id FS слоя - ограничение одновременных обращений к ней"
+    hashes: HashIndex = dataclasses.field(
+        default_factory=HashIndex, init=False, repr=False, compare=False
+    )
+    "Индекс содержимого файлов слоев всех узлов"
 
     # mirror - Зеркальные копии
     # union - слои присоединенных FS образуют общую FS
@@ -354,12 +1478,461 @@ class UnionFS:
     # Файл с одним full_name/hash на всех слоях FS, None - файла в слое нет
     # длина кортежа равна длине словаря layers, позиция в кортеже соответствует позиции в layers
 
-    def sync(self, node: Node = None):
+    LAYER_CONCURRENCY = 4
+    "Одновременных обращений к слою по умолчанию, если не задано FSLayer.params['concurrency']"
+    PARTIAL_SUFFIX = ".stors-partial"
+    "Суффикс имени файла, передаваемого между слоями: под своим именем файл появляется целиком"
+
+    def _layer_slot(self, layer: FSLayer) -> threading.BoundedSemaphore:
+        """
+        Ограничение одновременных обращений к FS слоя, общее для всех слоев и узлов с этой FS:
+        одно удаленное хранилище не получает больше params["concurrency"] запросов сразу
+        """
+        if (slot := self._layer_slots.get(id(layer.fs))) is None:
+            limit = layer.params.get("concurrency", self.LAYER_CONCURRENCY)
+            slot = self._layer_slots.setdefault(id(layer.fs), threading.BoundedSemaphore(limit))
+        return slot
+
+    def _transfer_slots(self, *layers: FSLayer) -> contextlib.ExitStack:
+        """
+        Занять ограничения обращений к FS нескольких слоев (см. _layer_slot), FS с общим хранилищем - один раз.
+        Ограничения занимаются в одном порядке, поэтому встречные передачи не ждут друг друга бесконечно
+        """
+        slots = {id(layer.fs): self._layer_slot(layer) for layer in layers}
+        stack = contextlib.ExitStack()
+        for key in sorted(slots):
+            stack.enter_context(slots[key])
+        return stack
+
+    def _report(self, report: "NodeReport", stage: str):
+        report.enter(stage)
+        if self.progress is not None:
+            self.progress(report)
+
+    def _list_layer(
+        self, node: Node, layer: FSLayer
+    ) -> tuple[tuple[LayerDelta, list[str]] | None, str | None]:
+        """
+        Прочитать слой узла: изменения со времени прошлой синхронизации, либо полный листинг
+
+        Returns
+        -------
+        (результат _layer_delta, ревизия слоя с лентой изменений на момент чтения)
+        """
+        with self._layer_slot(layer):
+            revision = layer.fs.revision() if isinstance(layer.fs, ChangeFeedFS) else None
+            if (found := self._layer_delta(node, layer)) is None:
+                layer.ls_indexed()
+                layer.fill_hashes()
+            return found, revision
+
+    def _snapshot_path(self, node: Node, layer: FSLayer) -> str | None:
+        if self.state_dir is None:
+            return None
+        return os.path.join(self.state_dir, f"{node.name}.{layer.key}.snapshot")
+
+    def _checkpoint_path(self, node: Node) -> str | None:
+        if self.state_dir is None:
+            return None
+        os.makedirs(self.state_dir, exist_ok=True)
+        return os.path.join(self.state_dir, f"{node.name}.journal")
+
+    def _layer_delta(self, node: Node, layer: FSLayer) -> tuple[LayerDelta, list[str]] | None:
+        """
+        Изменения слоя со времени последней успешной синхронизации.
+        Слой получает в качестве индекса снимок с этими изменениями.
+        FS с лентой изменений (ChangeFeedFS) сообщает их сама, для остальных сравнивается листинг со снимком
+
+        Returns
+        -------
+        (изменения, пути неразрешенных при прошлой синхронизации цепочек),
+        None - снимка нет, слой синхронизируется полностью
+        """
+        if (path := self._snapshot_path(node, layer)) is None or not os.path.exists(path):
+            return None
+        table, meta = RecordTable.load(path)
+        if isinstance(layer.fs, ChangeFeedFS) and meta.get("revision") is not None:
+            revision, changed, removed = layer.fs.changes_since(meta["revision"])
+            delta = LayerDelta(removed=list(removed), revision=revision)
+            for file in changed:
+                if file.full_name in table:
+                    delta.changed.append(file)
+                else:
+                    delta.added.append(file)
+        else:
+            delta = LayerDelta.between(table, layer.fs.ls())
+            unhashed = {
+                file.full_name: (files, num)
+                for files in (delta.added, delta.changed)
+                for num, file in enumerate(files)
+                if HashOfFile.of(file) is None and dataclasses.is_dataclass(file)
+            }
+            for full_name, content in layer.fs.get_hashes(unhashed):
+                if content is not None:
+                    files, num = unhashed[full_name]
+                    files[num] = dataclasses.replace(
+                        files[num], md5=content.md5, sha256=content.sha256
+                    )
+        layer.load_snapshot(table, delta)
+        return delta, meta.get("pending", [])
+
+    def _save_snapshots(
+        self, node: Node, revisions: dict[str, str], pending: list[str]
+    ):
+        """
+        Сохранить снимки слоев узла после синхронизации
+        Parameters
+        ----------
+        revisions : Ревизии слоев с лентой изменений, ключ - ключ слоя
+        pending : Пути цепочек, требующих ручного разрешения, проверяются при следующей синхронизации
+        """
+        if self.state_dir is None:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        for layer in node.layers:
+            table = layer.snapshot()
+            table.save(
+                self._snapshot_path(node, layer),
+                revision=revisions.get(layer.key),
+                pending=pending,
+            )
+            layer.load_snapshot(table)
+
+    def _build_chains(
+        self, node: Node, paths: ty.Iterable[str] = None
+    ) -> list[Chain]:
+        """
+        Цепочки файлов с одинаковыми полными именами на слоях узла (п.1, 2 алгоритма синхронизации),
+        строятся за один проход слиянием отсортированных листингов слоев (см. merge_chains)
+
+        Parameters
+        ----------
+        paths : Полные имена проверяемых файлов, None - все файлы всех слоев
+
+        Returns
+        -------
+        Неуспешные цепочки (файл есть не на всех слоях, либо хэши различаются), самые длинные первыми
+        """
+        if paths is not None:
+            paths = list(paths)
+        chains = merge_chains([layer.sorted_files(paths) for layer in node.layers])
+        return sorted(
+            (chain for chain in chains if not chain.equal),
+            key=lambda chain: chain.count,
+            reverse=True,
+        )
+
+    def _plan_inside_layer(
+        self, node: Node, file: FileInfo | FileRow, layer: FSLayer, moved: set[str]
+    ) -> Operation | None:
+        """
+        Операция получения файла file в слое layer без передачи данных между слоями (п.4 алгоритма):
+        в слое есть файл с тем же хэшем - переименовать его, создать на него ссылку или скопировать внутри слоя
+
+        Parameters
+        ----------
+        moved : Полные имена файлов, уже переименовываемых планом, пополняется
+
+        Returns
+        -------
+        None - в слое нет файла с тем же содержимым
+        """
+        if (content := HashOfFile.of(file)) is None:
+            return None
+        full_name = file.full_name
+        for found in self.hashes.find(content, layer):
+            found_name = found.resource.full_name
+            if found_name == full_name or found_name in moved:
+                continue
+            if not any(
+                other.exist(found_name) for other in node.layers if other is not layer
+            ):
+                # Файл один в своей цепочке: был перемещен, переносим его на новое место
+                kind = "rename"
+                moved.add(found_name)
+            elif layer.params.get("links"):
+                kind = "link"
+            else:
+                kind = "copy"
+            return Operation(
+                kind,
+                node.name,
+                full_name,
+                layer.key,
+                layer.key,
+                found_name,
+                file.size,
+                file_version(file),
+            )
+        return None
+
+    def _in_blacklist(self, file: FileInfo | FileRow) -> bool:
+        """
+        Файл из списка "не синхронизируемые": пока только недопереданные файлы
+        """
+        return file.full_name.endswith(self.PARTIAL_SUFFIX)
+
+    def _plan_copy(
+        self,
+        node: Node,
+        file: FileInfo | FileRow,
+        sources: list[FSLayer],
+        target: FSLayer,
+        moved: set[str],
+        report: NodeReport,
+    ) -> Operation:
+        """
+        Операция получения актуального файла file в слое target: внутри слоя, если там есть то же содержимое,
+        иначе копирование из слоев sources по стратегии слоя (выбор сохраняется в отчете узла)
+        """
+        if (op := self._plan_inside_layer(node, file, target, moved)) is not None:
+            return op
+        strategy = target.params.get("strategy", self.strategy)
+        choice = SourceChoice(
+            file.full_name,
+            file.size,
+            target.key,
+            strategy,
+            rank_sources(sources, target, file.size, strategy),
+        )
+        report.choices.append(choice)
+        best, *others = choice.candidates
+        return Operation(
+            "copy",
+            node.name,
+            file.full_name,
+            target.key,
+            best.layer,
+            size=file.size,
+            version=file_version(file),
+            seconds=best.seconds,
+            candidates=[estimate.layer for estimate in others],
+        )
+
+    def _plan_chains(
+        self, node: Node, chains: list[Chain], report: NodeReport
+    ) -> list[Operation]:
+        """
+        План синхронизации неуспешных цепочек узла (п.3-5 алгоритма синхронизации), слои не изменяются.
+        Актуальный файл цепочки - самый новый по времени изменения, он копируется в слои,
+        где файла нет или он другой. Разные файлы с одним временем изменения - конфликт
+        """
+        operations: list[Operation] = []
+        moved: set[str] = set()
+        for chain in chains:
+            report.processed += 1
+            if chain.full_name in moved:
+                # Файл переименовывается планом в другой цепочке
+                continue
+            present = [
+                (layer, file) for layer, file in zip(node.layers, chain.files) if file is not None
+            ]
+            if self._in_blacklist(present[0][1]):
+                continue
+            newest = max(RecordTable.to_epoch(file.modified) for _, file in present)
+            latest = [
+                file for _, file in present if RecordTable.to_epoch(file.modified) == newest
+            ]
+            actual = latest[0]
+            if not all(same_content(file, actual) for file in latest[1:]):
+                # Не смогли выбрать самый актуальный
+                operations.append(
+                    Operation("conflict", node.name, chain.full_name, size=actual.size)
+                )
+                report.manual += 1
+                continue
+            sources = [layer for layer, file in present if same_content(file, actual)]
+            for layer, file in zip(node.layers, chain.files):
+                if file is None or not same_content(file, actual):
+                    operations.append(
+                        self._plan_copy(node, actual, sources, layer, moved, report)
+                    )
+        return [op for op in operations if op.path not in moved]
+
+    def _layers(self) -> dict[str, dict[str, FSLayer]]:
+        """
+        Слои узлов: имя узла - ключ слоя - слой (ключи слоев уникальны только в пределах узла)
+        """
+        return {node.name: {layer.key: layer for layer in node.layers} for node in self.nodes}
+
+    @staticmethod
+    def _received(target: FSLayer, partial: str, file: FileInfo | FileRow) -> bool:
+        """
+        Записанный в слой target файл partial совпадает с источником file:
+        по размеру, и по хэшу, если хэш источника известен
+        """
+        if (written := target.fs.get(partial)) is None or written.size != file.size:
+            return False
+        if (content := HashOfFile.of(file)) is None:
+            return True
+        try:
+            written_content = target.fs.get_hash(partial)
+        except NotImplementedError:
+            return True
+        return written_content is None or (written_content.md5, written_content.sha256) == (
+            content.md5,
+            content.sha256,
+        )
+
+    def _transfer(self, op: Operation, layers: dict[str, FSLayer], journal: Journal = None):
+        """
+        Передать файл между слоями из op.source, при неудаче - из запасных источников op.candidates.
+        Файл пишется под временным именем (PARTIAL_SUFFIX) и переименовывается по завершении.
+        С журналом позиция передачи сохраняется после каждого блока, и прерванная передача
+        продолжается с нее, если FS источника и цели поддерживают чтение и запись с позиции.
+        Перед переименованием записанный файл сверяется с источником (см. _received),
+        продолженная передача при расхождении повторяется с начала.
+        Характеристики слоя-источника уточняются по каждой попытке
+        """
+        target = layers[op.target]
+        partial = op.path + self.PARTIAL_SUFFIX
+
+        def receive(source: FSLayer, file: FileInfo | FileRow, offset: int):
+            progress = None
+            if journal is not None:
+                progress = functools.partial(journal.record_offset, op, source.key)
+            with self._transfer_slots(source, target), source.open_read(op.path, offset) as stream:
+                target.receive(partial, stream, offset, file.modified, progress)
+
+        for key in [op.source, *op.candidates]:
+            source = layers[key]
+            if (file := source.get(op.path)) is None:
+                continue
+            offset = 0
+            if journal is not None and (resumed := journal.offset(op, key)):
+                written = target.fs.get(partial)
+                if written is not None and same_version(file, op.version):
+                    # Данных в частичном файле может оказаться меньше: они пишутся раньше журнала
+                    offset = min(resumed, written.size)
+            start = time.perf_counter()
+            try:
+                try:
+                    receive(source, file, offset)
+                except NotImplementedError:
+                    if not offset:
+                        raise
+                    # FS не поддерживает передачу с позиции, передаем заново
+                    offset = 0
+                    receive(source, file, offset)
+                received = self._received(target, partial, file)
+                if offset and not received:
+                    # Источник изменился после прерывания: начало файла от прежней версии
+                    offset = 0
+                    receive(source, file, offset)
+                    received = self._received(target, partial, file)
+                if not received:
+                    # Источник изменяется во время передачи
+                    target.rm(partial)
+                    continue
+                target.mv(partial, op.path, overwrite=True)
+            except NotImplementedError:
+                continue
+            except OSError:
+                source.learn_transfer(op.size - offset, time.perf_counter() - start, ok=False)
+                continue
+            source.learn_transfer(op.size - offset, time.perf_counter() - start)
+            copied = target.get(op.path)
+            if (
+                HashOfFile.of(copied) is None
+                and (content := HashOfFile.of(file)) is not None
+                and dataclasses.is_dataclass(copied)
+            ):
+                # Хэши копии известны по источнику, пересчитывать не нужно
+                target.remember(
+                    dataclasses.replace(copied, md5=content.md5, sha256=content.sha256)
+                )
+            return
+        raise CopyError(op.path)
+
+    def _execute(self, op: Operation, layers: dict[str, FSLayer], journal: Journal = None):
+        """
+        Выполнить операцию плана (кроме конфликта) и пометить ее выполненной
+        """
+        target = layers[op.target]
+        if op.kind == "rename":
+            target.mv(op.source_path, op.path, overwrite=True)
+            self.hashes.discard(op.source_path, target)
+        elif op.kind == "link":
+            # По пути op.path в слое может быть устаревшая версия: ссылка заменяет ее целиком
+            partial = op.path + self.PARTIAL_SUFFIX
+            if target.fs.exist(partial):
+                target.rm(partial)
+            target.link(op.source_path, partial)
+            target.mv(partial, op.path, overwrite=True)
+        elif op.transfer:
+            self._transfer(op, layers, journal)
+        else:
+            target.cp(op.source_path, op.path, overwrite=True)
+        if (copied := target.get(op.path)) is not None:
+            self.hashes.add(copied, target)
+        op.done = True
+        if journal is not None:
+            journal.record_done(op)
+
+    def execute(self, plan: Plan, checkpoint: str = None) -> list[Operation]:
         """
-        В режиме mirror - каждый слой копия других
+        Выполнить план синхронизации. Операции сгруппированы по слою назначения,
+        слои обрабатываются параллельно (не более workers одновременно).
+        Выполненные операции помечаются done, а помеченные пропускаются:
+        план, прерванный сбоем, можно сохранить и выполнить повторно
+
+        Parameters
+        ----------
+        checkpoint : Файл журнала выполнения (см. Journal). Операции, выполненные по журналу, пропускаются,
+            прерванные передачи продолжаются. Журнал удаляется, если все операции, кроме конфликтов, выполнены
+
         Returns
         -------
+        Невыполненные операции: конфликты и операции, завершившиеся ошибкой
+        """
+        layers = self._layers()
+        journal = Journal(checkpoint) if checkpoint is not None else None
+
+        def run(operations: list[Operation]) -> list[Operation]:
+            failed = []
+            for op in operations:
+                if journal is not None and journal.completed(op):
+                    op.done = True
+                    continue
+                try:
+                    self._execute(op, layers[op.node], journal)
+                except (CopyError, OSError):
+                    failed.append(op)
+            return failed
+
+        groups = list(plan.by_layer().values())
+        try:
+            with ThreadPoolExecutor(max(1, min(self.workers, len(groups)))) as pool:
+                failed = [op for operations in pool.map(run, groups) for op in operations]
+        finally:
+            if journal is not None:
+                journal.close()
+        if journal is not None and not failed:
+            journal.discard()
+        return plan.conflicts() + failed
+
+    def plan(self, node: Node = None) -> Plan:
+        """
+        План синхронизации без ее выполнения (см. sync)
+        """
+        reports = self.sync(node, dry_run=True)
+        return Plan([op for report in reports for op in report.operations])
 
+    def sync(self, node: Node = None, dry_run: bool = False) -> list["NodeReport"]:
+        """
+        В режиме mirror - каждый слой копия других.
+        Независимые узлы синхронизируются параллельно (не более workers одновременно),
+        слои каждого узла читаются параллельно, с ограничением обращений к слою (см. _layer_slot).
+        Для каждого узла составляется план (см. _plan_chains), который затем выполняется (см. execute)
+
+        Parameters
+        ----------
+        node : Синхронизировать только этот узел, None - все узлы
+        dry_run : Только составить план (NodeReport.operations), не изменяя слои и снимки
+
+        Returns
+        -------
+        Отчеты о синхронизации узлов, в порядке узлов
         """
 
         # def find_on_layers(file_fullname: str) -> list[ResourceOnFSLayer]:
@@ -381,61 +1954,6 @@ class UnionFS:
         def ls_files(fs: FSLayer) -> list[FileInfo]:
             ...
 
-        def fastest_sources_for_copyfrom(_from: FSLayer) -> tuple[str]:
-            ...
-
-        def inexpensive_sources_for_copyfrom(_from: FSLayer) -> tuple[str]:
-            ...
-
-        def reasonsable_sources_for_copyto(
-            _from: list[FSLayer],
-            target: FSLayer,
-            strategy: str = "fastest",
-        ) -> list[FSLayer]:
-            # TODO: доделать
-            return _from
-
-        def select_newest_files_from(
-            files: list[FileOnLayer],
-        ) -> list[FileOnLayer] | None:
-            # for flayer in files:
-            return sorted(
-                files, key=lambda flayer: flayer.resource.modified, reverse=True
-            )
-
-        def copy_from(sources: list[FileOnLayer], targets: list[FileOnLayer]):
-            """
-            Копирование файла из sources (выбрать лучший вариант), в слои targets
-            :param sources: Возможные источники с файлом
-            :type sources: список файла на разных слоях
-            :param targets:
-            :type targets:
-            :return:
-            :rtype:
-            """
-
-            def try_copy(source: FileOnLayer, target: FileOnLayer) -> bool:
-                raise NotImplemented
-
-            for target in targets:
-                for layer in reasonsable_sources_for_copyto(
-                    [flayer.fs for flayer in sources], target.fs
-                ):
-                    """
-                    Слои откуда копируем
-                    """
-                    copy_success = False
-                    for copy_source in [
-                        flayer for flayer in sources if flayer.fs is layer
-                    ]:
-                        if not try_copy(copy_source, target):
-                            # Копирование не удалось, пробуем из другого слоя
-                            continue
-                        copy_success = True
-                        break
-                    if not copy_success:
-                        raise CopyError
-
         # def cost_copy(to_fs: BaseFS) -> tuple[int]:
         #     """
         #     Список стоимости копирования данных из FS в layers
@@ -511,60 +2029,74 @@ class UnionFS:
             Можно использовать режим "доверять часам", и основываться на времени модификации.
         """
 
-        def in_blacklist(file: FileInfo) -> bool:
-            ...
-
-        _nodes = self.nodes if node is None else [node]
-
-        for _node in _nodes:
-            layer_num = 0
-            layers_items = _node.layers.items()
-            unsuccessful_chains: set[list[FileInfo | None]] = set()
-            manual_control_needed = []
-            for layer_name1, layer1 in layers_items:
-                layer1_ls = layer1.ls()
-                for file_1 in layer1_ls:
-                    chain = []
-                    flayer1 = FileOnLayer(file_1, layer1)
-                    if in_blacklist(file_1):
-                        continue
-                    chain += file_1
-                    for layer_name2, layer2 in layers_items[layer_num + 1 :]:
-                        if not (file_2 := layer2.get(file_1.full_name)):
-                            chain += None
-                            unsuccessful_chains += chain
-
-                        else:
-                            chain += file_2
-                            if file_1 != file_2:
-                                unsuccessful_chains += chain
-
-            unsuccessful_chains: list[list[FileInfo | None]] = sorted(
-                unsuccessful_chains, key=len, reverse=True
+        def sync_node(_node: Node, report: NodeReport, layers_pool: ThreadPoolExecutor):
+            self._report(report, "listing")
+            # Слои узла читаются параллельно: листинг облачных слоев ограничен вводом-выводом
+            listed = list(
+                layers_pool.map(lambda layer: self._list_layer(_node, layer), _node.layers)
             )
-
-            layers_values = list(self.layers.values())
-            for chain in unsuccessful_chains:
-                source_for_select = []
-                targets_for_copy = []
-                for layer_num, file1 in enumerate(chain):
-                    if file1 is None:
-                        targets_for_copy += FileOnLayer(None, layers_values[layer_num])
-                    else:
-                        source_for_select += FileOnLayer(
-                            file1, layers_values[layer_num]
-                        )
-
-                if not (source_for_copy := select_newest_files_from(source_for_select)):
-                    # Не смогли выбрать самые актуальные
-                    manual_control_needed += chain
+            revisions = {}
+            paths: set[str] | None = set()
+            for layer, (found, revision) in zip(_node.layers, listed):
+                if revision is not None:
+                    revisions[layer.key] = revision
+                if found is None:
+                    # Снимка нет, нужна полная синхронизация узла
+                    paths = None
+                    self.hashes.add_layer(layer)
+                    continue
+                delta, pending = found
+                if delta.revision is not None:
+                    revisions[layer.key] = delta.revision
+                if paths is not None:
+                    paths |= delta.paths | set(pending)
+                if self.hashes.indexed(layer):
+                    self.hashes.apply_delta(layer, delta)
                 else:
-                    copy_from(source_for_copy, targets_for_copy)
+                    self.hashes.add_layer(layer)
+
+            self._report(report, "chains")
+            unsuccessful_chains = self._build_chains(_node, paths)
+            report.chains = len(unsuccessful_chains)
+
+            self._report(report, "plan")
+            report.operations = self._plan_chains(_node, unsuccessful_chains, report)
+            if dry_run:
+                self._report(report, "done")
+                return
+
+            self._report(report, "copy")
+            not_done = self.execute(Plan(report.operations), self._checkpoint_path(_node))
+            report.failed = len(not_done) - report.manual
+
+            self._report(report, "snapshots")
+            # Конфликты и неудавшиеся копирования проверяются при следующей синхронизации
+            self._save_snapshots(_node, revisions, sorted({op.path for op in not_done}))
+            if (checkpoint := self._checkpoint_path(_node)) is not None and os.path.exists(
+                checkpoint
+            ):
+                with Journal(checkpoint) as journal:
+                    journal.compact()
+            self._report(report, "done")
 
-                # unsuccessful_chains -= chain
-                # for layer_num, file1 in enumerate(chain):
-                #     if file1 is None:
-                #         ...
+        _nodes = self.nodes if node is None else [node]
+        reports = [NodeReport(_node.name) for _node in _nodes]
+        layers_count = len({id(layer) for _node in _nodes for layer in _node.layers})
+        with ThreadPoolExecutor(max(1, layers_count)) as layers_pool, ThreadPoolExecutor(
+            max(1, self.workers)
+        ) as nodes_pool:
+            futures = {
+                nodes_pool.submit(sync_node, _node, report, layers_pool): report
+                for _node, report in zip(_nodes, reports)
+            }
+            for future in futures:
+                if (error := future.exception()) is not None:
+                    futures[future].error = error
+                    self._report(futures[future], "failed")
+        for report in reports:
+            if report.error is not None:
+                raise report.error
+        return reports
 
     #
     # processed_file = []
@@ -613,16 +2145,45 @@ class VirtualFS:
     temp_fs: TempFS = None
 
     _fs_items: dict[BaseFS, list[FileInfo]] = {}
-    _hashs: dict[HashOfFile, list[FileInfo]] = {}
-    _items: dict[str, tuple[FileInfo, BaseFS]] = {}
-    _mpoints: dict[str, list[BaseFS]] = {}
+    _hashs: HashIndex = HashIndex()
     """
     плоский общий словарь элементов файловых структур пула,
     ключ - хэш элемента, значение - список файлов
     """
+    _items: dict[str, tuple[FileInfo, BaseFS]] = {}
+    _mpoints: dict[str, list[BaseFS]] = {}
 
-    def _calculate_hash_fs(self):
-        ...
+    def __init__(self):
+        self.fstab = {}
+        self._fs_items = {}
+        self._hashs = HashIndex()
+        self._items = {}
+        self._mpoints = {}
+
+    def _calculate_hash_fs(self, layer: FSLayer):
+        """
+        Заносит файлы слоя в индекс содержимого, недостающие хэши запрашивает у FS
+        Parameters
+        ----------
+        layer : слой присоединенной ФС
+        """
+        self._hashs.remove_layer(layer)
+        unhashed: dict[str, FileInfo] = {}
+        for file in layer.ls():
+            if file.is_folder:
+                continue
+            if HashOfFile.of(file) is not None:
+                self._hashs.add(file, layer)
+            elif dataclasses.is_dataclass(file):
+                unhashed[file.full_name] = file
+        # Недостающие хэши FS может считать пакетом (LocalFS - параллельно)
+        for full_name, content in layer.fs.get_hashes(unhashed):
+            if content is None:
+                continue
+            file = dataclasses.replace(
+                unhashed[full_name], md5=content.md5, sha256=content.sha256
+            )
+            self._hashs.add(file, layer)
 
     def get_hash(self, file: str) -> HashOfFile:
         """
@@ -635,7 +2196,7 @@ class VirtualFS:
         -------
 
         """
-        ...
+        return self.get_manager(file).get_hash(file)
 
     def attach_fs(
         self, fs: BaseFS, key_fs: str, mount_point: str, property: dict = None
@@ -651,7 +2212,7 @@ class VirtualFS:
         -------
 
         """
-        # self._calculate_hash_fs(fs)
+        self._calculate_hash_fs(FSLayer(key_fs, fs, property or {}))
 
         # ..
 
@@ -1185,6 +1185,19 @@ def _dataclass_setstate(self, state):
         object.__setattr__(self, field.name, value)
 
 
+def _get_slots(cls):
+    slots = cls.__dict__.get("__slots__")
+    if slots is None:
+        return ()
+    if isinstance(slots, str):
+        return (slots,)
+    # Slots may be any iterable, but we cannot handle an iterator
+    # because it will already be (partially) consumed.
+    if hasattr(slots, "__next__"):
+        raise TypeError(f"Slots of '{cls.__name__}' cannot be determined")
+    return tuple(slots)
+
+
 def _add_slots(cls, is_frozen):
     # Need to create a new class, since we can't set __slots__
     #  after a class has been created.
@@ -1196,7 +1209,15 @@ def _add_slots(cls, is_frozen):
     # Create a new dict for our new class.
     cls_dict = dict(cls.__dict__)
     field_names = tuple(f.name for f in fields(cls))
-    cls_dict["__slots__"] = field_names
+    # Make sure slots don't overlap with those in base classes, so that
+    # a slotted dataclass can inherit from another slotted dataclass
+    # without duplicating the inherited fields in every instance.
+    inherited_slots = {
+        slot for base in cls.__mro__[1:-1] for slot in _get_slots(base)
+    }
+    cls_dict["__slots__"] = tuple(
+        name for name in field_names if name not in inherited_slots
+    )
     for field_name in field_names:
         # Remove our attributes, if present. They'll still be
         #  available in _MARKER.
@@ -1205,6 +1226,9 @@ def _add_slots(cls, is_frozen):
     # Remove __dict__ itself.
     cls_dict.pop("__dict__", None)
 
+    # Clear existing `__weakref__` descriptor, it belongs to a previous type.
+    cls_dict.pop("__weakref__", None)
+
     # And finally create the class.
     qualname = getattr(cls, "__qualname__", None)
     cls = type(cls)(cls.__name__, cls.__bases__, cls_dict)
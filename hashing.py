@@ -0,0 +1,198 @@
+"""
+Вычисление хэшей файлов: md5 и sha256 считаются за одно чтение файла,
+множество файлов хэшируется параллельно в пуле потоков (hashlib освобождает GIL)
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import typing as ty
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+BUFFER_SIZE = 1 << 20
+"Размер буфера чтения файла"
+
+T = ty.TypeVar("T")
+
+Digests: ty.TypeAlias = tuple[str, str, int]
+"(md5, sha256, size) - в порядке полей commander.HashOfFile"
+
+
+def file_digests(path: str | os.PathLike, buffer: bytearray = None) -> Digests:
+    """
+    Считает md5 и sha256 файла за один проход, читая его в переиспользуемый буфер
+    Parameters
+    ----------
+    path : Путь к файлу
+    buffer : Буфер чтения, если не передан - создается новый
+
+    Returns
+    -------
+    (md5, sha256, размер файла)
+    """
+    if buffer is None:
+        buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    md5 = hashlib.md5()
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(path, "rb", buffering=0) as file:
+        while read := file.readinto(buffer):
+            chunk = view[:read]
+            md5.update(chunk)
+            sha256.update(chunk)
+            size += read
+    return md5.hexdigest(), sha256.hexdigest(), size
+
+
+class HashEngine:
+    """
+    Пул потоков для хэширования файлов, у каждого потока свой буфер чтения
+    """
+
+    def __init__(self, workers: int = None, buffer_size: int = BUFFER_SIZE):
+        self.workers = workers or os.cpu_count() or 1
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _buffer(self) -> bytearray:
+        if (buffer := getattr(self._local, "buffer", None)) is None:
+            buffer = self._local.buffer = bytearray(self.buffer_size)
+        return buffer
+
+    def hash_file(self, path: str | os.PathLike) -> Digests:
+        return file_digests(path, self._buffer())
+
+    def hash_files(
+        self,
+        items: ty.Iterable[T],
+        path: ty.Callable[[T], str | os.PathLike] = None,
+    ) -> ty.Iterator[tuple[T, Digests]]:
+        """
+        Хэширует файлы параллельно, результаты выдает в порядке items.
+        В работе одновременно не больше 2*workers файлов, поэтому items может быть длинным генератором
+        Parameters
+        ----------
+        items : Файлы
+        path : Путь к файлу элемента items, по умолчанию элемент и есть путь
+
+        Returns
+        -------
+        Пары (элемент items, (md5, sha256, размер))
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="hash"
+            )
+        pending: deque[tuple[T, Future]] = deque()
+        for item in items:
+            file_path = item if path is None else path(item)
+            pending.append((item, self._executor.submit(self.hash_file, file_path)))
+            if len(pending) >= 2 * self.workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class HashCache:
+    """
+    Постоянный кэш хэшей локальных файлов в SQLite.
+    Ключ - (устройство, inode), хэш действителен, пока у файла не изменились размер и mtime_ns
+    """
+
+    COMMIT_EVERY = 1000
+    "Количество записей между фиксациями транзакции"
+
+    def __init__(self, path: str | os.PathLike = ":memory:"):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+            "md5 TEXT, sha256 TEXT, PRIMARY KEY (dev, ino))"
+        )
+
+    def lookup(self, stat: os.stat_result) -> Digests | None:
+        """
+        Хэши файла, если файл не изменился с момента их сохранения
+        Parameters
+        ----------
+        stat : Результат os.stat файла
+
+        Returns
+        -------
+        (md5, sha256, size) или None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT md5, sha256 FROM hashes "
+                "WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ?",
+                (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0], row[1], stat.st_size
+
+    def store(self, stat: os.stat_result, digests: Digests):
+        """
+        Сохранить хэши файла
+        Parameters
+        ----------
+        stat : Результат os.stat файла, полученный до вычисления хэшей
+        digests : (md5, sha256, size)
+        """
+        md5, sha256, size = digests
+        if size != stat.st_size:
+            # Файл изменился во время чтения
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                (stat.st_dev, stat.st_ino, size, stat.st_mtime_ns, md5, sha256),
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.COMMIT_EVERY:
+                self._db.commit()
+                self._uncommitted = 0
+
+    def flush(self):
+        with self._lock:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def stats(self) -> dict[str, int]:
+        """
+        Статистика обращений к кэшу
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,12 +1,14 @@
 import inspect
+import sys
+import typing
 from datetime import datetime
-from functools import partial
+from functools import lru_cache, partial
 
 import dateutil.parser
 
-from dataclasses import MISSING
+from dataclasses import MISSING, _create_fn
 from typing import TypeVar
-from utils import get_origin_type
+from utils import full_annotations, resolve_annotations
 import enum
 
 
@@ -22,6 +24,418 @@ class T_MissingFieldBehavior(enum.Enum):
 
 T = TypeVar("T")
 
+_RECORD_DECODER = "__record_decoder__"
+"Имя атрибута класса, в котором хранится скомпилированный декодер"
+
+_RECORD_TYPES = "__record_types__"
+"Имя атрибута класса, в котором хранятся разрешенные типы полей"
+
+_RECORD_FIELDS = "__record_fields__"
+"Имя атрибута класса, в котором хранится множество имен полей"
+
+_RECORD_READERS = "__record_readers__"
+"Имя атрибута класса, в котором хранятся функции чтения полей для ленивого режима"
+
+_RECORD_RAW = "__record_raw__"
+"""
+Имя атрибута объекта ленивого режима: исходный словарь, либо, если поведение задано при создании объекта
+и отличается от поведения класса, - (исходный словарь, missing_key_behavior, значение отсутствующего поля)
+"""
+
+_RECORD_LAZY = "__record_lazy__"
+"Имя атрибута класса ленивого режима: (missing_key_behavior, значение отсутствующего поля) по умолчанию"
+
+_COMPACT_ATTRIBUTES = sys.implementation.name == "cpython" and sys.version_info >= (3, 11)
+"""
+Атрибуты объекта хранятся в компактном массиве значений, ключи которого общие для объектов класса.
+Это деталь реализации CPython 3.11+, от нее зависит память объектов ленивого режима (см. _prime_lazy_layout)
+"""
+
+_RECORD_SOURCE = "__record_source__"
+"Имя атрибута объекта, в котором хранится исходный словарь (только при keep_source=True)"
+
+_NOT_STORED = object()
+"Маркер: отсутствующее поле не сохраняется в объекте"
+
+
+def _missing_field_value(missing_field_behavior: T_MissingFieldBehavior) -> ...:
+    """
+    Значение, присваиваемое полям, не нашедшим пару в ключах словаря
+    """
+    if isinstance(missing_field_behavior, T_MissingFieldBehavior):
+        return missing_field_behavior.value
+    return _NOT_STORED
+
+
+def _store_missing_keys(
+    self,
+    cls: type,
+    keys: typing.Iterable[str],
+    from_dict: dict[str],
+    missing_key_behavior: T_MissingKeyBehavior,
+):
+    """
+    Сохраняет ключи словаря, не нашедшие пару в полях объекта, в соответствии с missing_key_behavior
+    """
+    for key in keys:
+        if hasattr(cls, key):
+            # Атрибут уже установлен на уровне класса
+            continue
+        if missing_key_behavior == T_MissingKeyBehavior.store_as_attr:
+            setattr(self, key, from_dict[key])
+        elif missing_key_behavior == T_MissingKeyBehavior.store_as_internal:
+            if not getattr(self, "__missing_keys__", None):
+                self.__missing_keys__ = {}
+            self.__missing_keys__[key] = from_dict[key]
+
+
+def _field_types(cls: type) -> dict[str, type]:
+    """
+    Типы полей record-класса, строковые аннотации разрешаются один раз в пространстве имен модуля класса
+    """
+    if (types := cls.__dict__.get(_RECORD_TYPES)) is None:
+        types = resolve_annotations(cls)
+        setattr(cls, _RECORD_TYPES, types)
+    return types
+
+
+def _field_names(cls: type) -> frozenset[str]:
+    """
+    Имена полей record-класса, вычисляются один раз
+    """
+    if (names := cls.__dict__.get(_RECORD_FIELDS)) is None:
+        names = frozenset(_field_types(cls))
+        setattr(cls, _RECORD_FIELDS, names)
+    return names
+
+
+@lru_cache(maxsize=4096)
+def _parse_datetime(value: str) -> datetime:
+    """
+    Разбор строки с датой: ISO 8601 (формат API Яндекс.Диска) - через datetime.fromisoformat,
+    остальные форматы - через dateutil. Повторяющиеся строки (например, одинаковые
+    created/modified в листинге) берутся из кеша
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+def _cast_to(key_type: type) -> typing.Callable:
+    """
+    Конвертер значения к типу поля key_type
+    """
+
+    def cast(value):
+        if callable(value):
+            return value(value)
+        # Попытаемся привести тип
+        try:
+            if (key_type == datetime) and isinstance(value, str):
+                return _parse_datetime(value)
+            return key_type(value)
+        except TypeError:
+            # Значение не приводится к типу поля, сохраняется как есть
+            return value
+
+    return cast
+
+
+def _group_dotted(from_dict: dict[str], prefixes: typing.Container[str]) -> dict[str, dict[str]]:
+    """
+    Группирует за один проход ключи словаря вида "префикс.ключ" (например, "user.login", "user.uid")
+    по префиксу, для префиксов из prefixes - имен полей вложенных record-классов
+
+    Returns
+    -------
+    Словарь префикс - словарь {остаток ключа: значение}
+    """
+    groups: dict[str, dict[str]] = {}
+    for param_key, param_value in from_dict.items():
+        prefix, dot, rest = param_key.partition(".")
+        if dot and prefix in prefixes:
+            if (group := groups.get(prefix)) is None:
+                group = groups[prefix] = {}
+            group[rest] = param_value
+    return groups
+
+
+def _nested_record(key_type: type) -> typing.Callable:
+    """
+    Конвертер словаря в экземпляр вложенного record-класса key_type
+    """
+
+    def nested(value, group: dict[str] = None):
+        if group is not None:
+            # Ключи "поле.ключ" дополняют (или заменяют отсутствующий) словарь поля
+            if isinstance(value, dict):
+                value = value | group
+            elif value is MISSING:
+                value = group
+        if isinstance(value, key_type):
+            return value
+        return key_type(from_dict=value)
+
+    return nested
+
+
+def _compile_decoder(cls: type) -> typing.Callable:
+    """
+    Генерирует для record-класса функцию заполнения экземпляра из словаря.
+    Вся рефлексия (разбор аннотаций, поиск типов, выбор конвертеров) выполняется один раз,
+    сгенерированный код содержит для каждого поля только выборку из словаря,
+    проверку типа и, при необходимости, вызов конвертера
+
+    Parameters
+    ----------
+    cls : record-класс
+
+    Returns
+    -------
+    Функция (self, from_dict, missing_key_behavior, missing_value)
+    """
+    annotations = _field_types(cls)
+    nested_fields = frozenset(
+        key
+        for key, key_type in annotations.items()
+        if hasattr(key_type, "__is_record__") and not hasattr(cls, key)
+    )
+    _locals = {
+        "__cls__": cls,
+        "__known__": _field_names(cls),
+        "__nested__": nested_fields,
+        "__group_dotted__": _group_dotted,
+        "__store_missing_keys__": _store_missing_keys,
+        "MISSING": MISSING,
+        "_NOT_STORED": _NOT_STORED,
+    }
+    body = []
+    for key, key_type in annotations.items():
+        if hasattr(cls, key):
+            # Если атрибут на уровне класса,
+            # делаем его копию на уровне объекта, чтобы не портить класс.
+            # Значение из словаря такому полю не назначается
+            body.insert(0, f"self.{key} = __cls__.{key}")
+            continue
+        body.append(f"value = from_dict.get({key!r}, MISSING)")
+        if key in nested_fields:
+            _locals[f"__conv_{key}__"] = _nested_record(key_type)
+            body += [
+                f"if {key!r} in dotted:",
+                f"  value = __conv_{key}__(value, dotted[{key!r}])",
+            ]
+        body.append("if value is not MISSING:")
+        if inspect.isdatadescriptor(key_type):
+            pass
+        elif key in nested_fields:
+            _locals[f"__type_{key}__"] = key_type
+            body += [
+                f"  if not isinstance(value, __type_{key}__):",
+                f"    value = __conv_{key}__(value)",
+            ]
+        elif isinstance(check_type := typing.get_origin(key_type) or key_type, type):
+            _locals[f"__type_{key}__"] = check_type
+            _locals[f"__conv_{key}__"] = _cast_to(check_type)
+            body += [
+                f"  if not isinstance(value, __type_{key}__):",
+                f"    value = __conv_{key}__(value)",
+            ]
+        body += [
+            f"  self.{key} = value",
+            "elif missing_value is not _NOT_STORED:",
+            f"  self.{key} = missing_value",
+        ]
+    extra_keys = ["if extra_keys := from_dict.keys() - __known__:"]
+    if nested_fields:
+        body.insert(0, "dotted = __group_dotted__(from_dict, __nested__)")
+        extra_keys += [
+            "  if dotted:",
+            "    extra_keys = {key for key in extra_keys if key.partition('.')[0] not in dotted}",
+        ]
+    body += extra_keys + [
+        "  __store_missing_keys__(self, __cls__, extra_keys, from_dict, missing_key_behavior)",
+    ]
+    return _create_fn(
+        "__record_decode__",
+        ("self", "from_dict", "missing_key_behavior", "missing_value"),
+        body,
+        locals=_locals,
+    )
+
+
+def _get_decoder(cls: type) -> typing.Callable:
+    """
+    Возвращает декодер record-класса, компилируя его при первом обращении
+    """
+    if (decoder := cls.__dict__.get(_RECORD_DECODER)) is None:
+        decoder = _compile_decoder(cls)
+        setattr(cls, _RECORD_DECODER, decoder)
+    return decoder
+
+
+def _field_reader(key: str, key_type: type) -> typing.Callable:
+    """
+    Функция чтения поля key из исходного словаря с приведением к типу поля,
+    выполняет для одного поля ту же работу, что и декодер из _compile_decoder
+    """
+    check_type = convert = nested = None
+    if inspect.isdatadescriptor(key_type):
+        pass
+    elif hasattr(key_type, "__is_record__"):
+        check_type = key_type
+        convert = nested = _nested_record(key_type)
+    elif isinstance(origin := typing.get_origin(key_type) or key_type, type):
+        check_type, convert = origin, _cast_to(origin)
+
+    def read(from_dict: dict[str]):
+        value = from_dict.get(key, MISSING)
+        if nested is not None and (group := _group_dotted(from_dict, (key,)).get(key)):
+            value = nested(value, group)
+        if value is not MISSING and convert is not None and not isinstance(value, check_type):
+            value = convert(value)
+        return value
+
+    return read
+
+
+def _field_readers(cls: type) -> dict[str, typing.Callable]:
+    """
+    Функции чтения полей record-класса для ленивого режима, создаются один раз
+    """
+    if (readers := cls.__dict__.get(_RECORD_READERS)) is None:
+        readers = {
+            key: _field_reader(key, key_type)
+            for key, key_type in _field_types(cls).items()
+            if not hasattr(cls, key)
+        }
+        setattr(cls, _RECORD_READERS, readers)
+    return readers
+
+
+def _lazy_decode(
+    self,
+    from_dict: dict[str],
+    missing_key_behavior: T_MissingKeyBehavior,
+    missing_value,
+):
+    """
+    Декодер ленивого режима: сохраняет исходный словарь,
+    поля приводятся к типу при первом обращении (см. _lazy_getattr)
+    """
+    default_key_behavior, default_value = getattr(type(self), _RECORD_LAZY)
+    if missing_key_behavior is default_key_behavior and missing_value is default_value:
+        setattr(self, _RECORD_RAW, from_dict)
+    else:
+        setattr(self, _RECORD_RAW, (from_dict, missing_key_behavior, missing_value))
+
+
+def _lazy_state(obj) -> tuple[dict[str], T_MissingKeyBehavior, typing.Any] | None:
+    """
+    (исходный словарь, missing_key_behavior, значение отсутствующего поля) объекта ленивого режима,
+    None - объект создан не в ленивом режиме
+    """
+    # Без обращения к obj.__dict__: оно создает словарь атрибутов вместо компактного хранения в объекте
+    try:
+        state = object.__getattribute__(obj, _RECORD_RAW)
+    except AttributeError:
+        return None
+    if type(state) is tuple:
+        return state
+    return (state, *getattr(type(obj), _RECORD_LAZY))
+
+
+def _prime_lazy_layout(cls: type, names: typing.Iterable[str]):
+    """
+    Заполнить общие ключи атрибутов объектов класса пробным объектом (только при _COMPACT_ATTRIBUTES).
+    Размер компактного массива значений определяется при создании объекта по уже известным ключам.
+    Без пробного объекта поле, прочитанное после создания объекта, не помещается в массив,
+    и объект получает отдельный словарь атрибутов (около 300 байт)
+    """
+    try:
+        probe = object.__new__(cls)
+        for name in names:
+            if not hasattr(cls, name):
+                object.__setattr__(probe, name, None)
+    except (AttributeError, TypeError):
+        # Класс без словаря атрибутов (__slots__) или со своим __new__
+        pass
+
+
+def _is_extra_key(cls: type, key: str) -> bool:
+    """
+    Ключ словаря не имеет пары в полях и не передается вложенному record-классу как "поле.ключ"
+    """
+    return (
+        key not in _field_names(cls)
+        and not hasattr(cls, key)
+        and not hasattr(_field_types(cls).get(key.partition(".")[0]), "__is_record__")
+    )
+
+
+def _lazy_getattr(self, name: str):
+    """
+    Первое обращение к полю объекта ленивого режима: значение читается из исходного словаря,
+    приводится к типу поля и сохраняется в объекте, следующие обращения его не вызывают
+    """
+    if (state := _lazy_state(self)) is None:
+        raise AttributeError(name)
+    from_dict, missing_key_behavior, missing_value = state
+    cls = type(self)
+    if (reader := _field_readers(cls).get(name)) is not None:
+        if (value := reader(from_dict)) is MISSING:
+            if missing_value is _NOT_STORED:
+                raise AttributeError(name)
+            value = missing_value
+    elif (
+        name == "__missing_keys__"
+        and missing_key_behavior == T_MissingKeyBehavior.store_as_internal
+    ):
+        value = {key: item for key, item in from_dict.items() if _is_extra_key(cls, key)}
+        if not value:
+            raise AttributeError(name)
+    elif (
+        missing_key_behavior == T_MissingKeyBehavior.store_as_attr
+        and name in from_dict
+        and _is_extra_key(cls, name)
+    ):
+        value = from_dict[name]
+    else:
+        raise AttributeError(name)
+    setattr(self, name, value)
+    return value
+
+
+def _lazy_dir(self) -> list[str]:
+    """
+    Имена атрибутов объекта ленивого режима, включая еще не прочитанные поля
+    """
+    names = set(object.__dir__(self))
+    if (state := _lazy_state(self)) is not None:
+        from_dict, missing_key_behavior, missing_value = state
+        cls = type(self)
+        dotted = {key.partition(".")[0] for key in from_dict if "." in key}
+        names.update(
+            key
+            for key in _field_readers(cls)
+            if missing_value is not _NOT_STORED or key in from_dict or key in dotted
+        )
+        if missing_key_behavior == T_MissingKeyBehavior.store_as_attr:
+            names.update(key for key in from_dict if _is_extra_key(cls, key))
+    return sorted(names)
+
+
+def record_source(obj) -> dict[str] | None:
+    """
+    Исходный словарь, из которого создан объект record-класса.
+    Сохраняется только для классов с keep_source=True и для объектов ленивого режима, иначе - None
+    """
+    if (source := getattr(obj, _RECORD_SOURCE, None)) is not None:
+        return source
+    if (state := _lazy_state(obj)) is not None:
+        return state[0]
+    return None
+
 
 def record(
     cls: type[T] = None,
@@ -29,6 +443,9 @@ def record(
     *,
     missing_key_behavior: T_MissingKeyBehavior = T_MissingKeyBehavior.store_as_attr,
     missing_field_behavior: T_MissingFieldBehavior = T_MissingFieldBehavior.store_as_MISSING,
+    compiled: bool = True,
+    lazy: bool = False,
+    keep_source: bool = False,
     **kwargs,
 ):
     """
@@ -45,41 +462,67 @@ def record(
         "store_as_MISSING" - сохранять, назначая им значение MISSING (по умолчанию)
         "store_as_None" - сохранять, назначая им значение None,
         иначе - удалять из объекта
+    compiled : Заполнять объект сгенерированным для класса декодером (по умолчанию),
+        иначе - разбирать словарь через рефлексию при создании каждого объекта
+    lazy : Сохранять в объекте исходный словарь и приводить поле к типу при первом обращении к нему,
+        результат сохраняется в объекте. Выгоден, когда из больших листингов читается несколько полей.
+        Объект удерживает исходный словарь, пока существует. Объекты занимают меньше памяти, чем с приведением
+        всех полей, только в CPython 3.11+ (см. _COMPACT_ATTRIBUTES), иначе прочитанные поля хранятся
+        в отдельном словаре атрибутов каждого объекта
+    keep_source : Сохранять в объекте ссылку на исходный словарь (см. record_source),
+        по умолчанию объект не удерживает словарь в памяти
     kwargs :
 
     Returns
     -------
 
     """
+    # Поведение по умолчанию для класса, только для чтения:
+    # переопределения из __init__ и from_dicts действуют лишь на один вызов
     _missing_key_behavior = missing_key_behavior
     _missing_field_behavior = missing_field_behavior
-    # _params: dict[str] = {}
-    _assign_fields = set()
 
     def fromdict(
         self: T,
         from_dict: dict[str],
+        missing_key_behavior: T_MissingKeyBehavior,
+        missing_field_behavior: T_MissingFieldBehavior,
     ) -> T:
         """
 
         Parameters
         ----------
         self : object
+        missing_key_behavior : см. record
+        missing_field_behavior : см. record
         """
         found_fields = set()
         annotations: dict[str] = self.__annotations__
-        for key, value in from_dict.items():
+        types = _field_types(type(self))
+        items = from_dict.items()
+        dotted = _group_dotted(
+            from_dict,
+            {key for key, key_type in types.items() if hasattr(key_type, "__is_record__")},
+        )
+        if dotted:
+            # Ключи "поле.ключ" передаются вложенному record-классу, а не сохраняются как есть
+            items = dict.fromkeys(dotted, MISSING) | {
+                key: value
+                for key, value in items
+                if key.partition(".")[0] not in dotted
+            }
+            items = items.items()
+        for key, value in items:
             # Проходим по словарю
             if hasattr(self, key):
                 # Атрибут уже установлен
                 attr_value = getattr(self, key)
                 if inspect.isdatadescriptor(attr_value):
-                    _assign_fields.add(key)
                     setattr(self, key, attr_value)
             elif key_type := annotations.get(key, None):
                 # Найдено соответствие в полях
                 found_fields.add(key)
-                key_type = get_origin_type(key_type)
+                key_type = types[key]
 
                 # if key in _params:
                 #     # Поищем значение в дополнительных параметрах
@@ -88,18 +531,8 @@ def record(
                     _value = key_type()
                     _value.__set_name__(self.__class__, key)
                     setattr(self, key, value)
-                    _assign_fields.add(key)
                 elif hasattr(key_type, "__is_record__"):
-                    # _pparams = {}
-                    # value: dict
-                    for param_key, param_value in from_dict.items():
-                        if (
-                            len((chunks := param_key.split("."))) > 1
-                            and chunks[0] == key
-                        ):
-                            value[".".join(chunks[1:])] = param_value
-                            break
-                    value = key_type(from_dict=value)
+                    value = _nested_record(key_type)(value, dotted.get(key))
                 elif callable(value):
                     value = value(value)
                 elif not isinstance(value, key_type):
@@ -107,7 +540,7 @@ def record(
                     try:
                         if (key_type == datetime) and isinstance(value, str):
                             # value: str
-                            value = dateutil.parser.parse(value)
+                            value = _parse_datetime(value)
                         else:
                             value = key_type(value)
                     except TypeError as err:
@@ -116,28 +549,23 @@ def record(
                         # value
                         # raise err
 
-                _assign_fields.add(key)
                 setattr(self, key, value)
-            elif _missing_key_behavior == T_MissingKeyBehavior.store_as_attr:
-                _assign_fields.add(key)
+            elif missing_key_behavior == T_MissingKeyBehavior.store_as_attr:
                 setattr(self, key, value)
-            elif _missing_key_behavior == T_MissingKeyBehavior.store_as_internal:
+            elif missing_key_behavior == T_MissingKeyBehavior.store_as_internal:
                 if not getattr(self, "__missing_keys__", None):
                     self.__missing_keys__ = {}
                 self.__missing_keys__[key] = value
 
-            _fields = set(annotations.keys())
-            for field in _fields - found_fields:
-                if hasattr(self, field):
-                    # Поле уже имеет значение, не трогаем
-                    _assign_fields.add(field)
-                    continue
-                if _missing_field_behavior == T_MissingFieldBehavior.store_as_MISSING:
-                    _assign_fields.add(field)
-                    setattr(self, field, MISSING)
-                elif _missing_field_behavior == T_MissingFieldBehavior.store_as_None:
-                    _assign_fields.add(field)
-                    setattr(self, field, None)
+        # Поля, не нашедшие пару в ключах словаря, обрабатываются один раз, после разбора всех ключей
+        for field in _field_names(type(self)) - found_fields:
+            if hasattr(self, field):
+                # Поле уже имеет значение, не трогаем
+                continue
+            if missing_field_behavior == T_MissingFieldBehavior.store_as_MISSING:
+                setattr(self, field, MISSING)
+            elif missing_field_behavior == T_MissingFieldBehavior.store_as_None:
+                setattr(self, field, None)
         return self
 
     def __init__(
@@ -147,29 +575,99 @@ def record(
         missing_key_behavior: T_MissingKeyBehavior = None,
         missing_field_behavior: T_MissingFieldBehavior = None,
     ):
-        nonlocal _missing_key_behavior, _missing_field_behavior
-        if missing_key_behavior is not None:
-            _missing_key_behavior = missing_key_behavior
-        if missing_field_behavior is not None:
-            _missing_field_behavior = missing_field_behavior
-        # if params is not None:
-        #     _params = params
-
-        obj_fields: dict[str] = self.__annotations__
-        for key, value in obj_fields.items():
-            if hasattr(type(self), key):
-                # Если атрибут на уровне класса,
-                # делаем его копию на уровне объекта, чтобы не портить класс
-                att_value = getattr(type(self), key)
-                _assign_fields.add(key)
-                setattr(self, key, att_value)
-
-        self.__is_record__["from_dict"] = from_dict
-        # self.__is_record__["params"] = params
-        fromdict(self, from_dict=from_dict)
+        if missing_key_behavior is None:
+            missing_key_behavior = _missing_key_behavior
+        if missing_field_behavior is None:
+            missing_field_behavior = _missing_field_behavior
+
+        if keep_source:
+            setattr(self, _RECORD_SOURCE, from_dict)
+        if from_dict is None:
+            from_dict = {}
+        if lazy:
+            _lazy_decode(
+                self,
+                from_dict,
+                missing_key_behavior,
+                _missing_field_value(missing_field_behavior),
+            )
+        elif compiled:
+            _get_decoder(type(self))(
+                self,
+                from_dict,
+                missing_key_behavior,
+                _missing_field_value(missing_field_behavior),
+            )
+        else:
+            obj_fields: dict[str] = self.__annotations__
+            for key, value in obj_fields.items():
+                if hasattr(type(self), key):
+                    # Если атрибут на уровне класса,
+                    # делаем его копию на уровне объекта, чтобы не портить класс
+                    att_value = getattr(type(self), key)
+                    setattr(self, key, att_value)
+
+            fromdict(self, from_dict, missing_key_behavior, missing_field_behavior)
         if hasattr(self, "__post_init__") and callable(self.__post_init__):
             self.__post_init__()
 
+    @classmethod
+    def from_dicts(
+        record_cls: type[T],
+        items: typing.Iterable[dict[str]],
+        /,
+        as_list: bool = False,
+        missing_key_behavior: T_MissingKeyBehavior = None,
+        missing_field_behavior: T_MissingFieldBehavior = None,
+    ) -> typing.Iterator[T] | list[T]:
+        """
+        Создает объекты класса из последовательности словарей (например, _embedded.items листинга).
+        Декодер, поведение для отсутствующих ключей и полей, __post_init__ определяются один раз на весь поток
+
+        Parameters
+        ----------
+        items : Итерируемый объект или генератор словарей
+        as_list : Вернуть список объектов, иначе - ленивый генератор
+        missing_key_behavior : см. record
+        missing_field_behavior : см. record
+
+        Returns
+        -------
+
+        """
+        key_behavior = (
+            _missing_key_behavior if missing_key_behavior is None else missing_key_behavior
+        )
+        field_behavior = (
+            _missing_field_behavior
+            if missing_field_behavior is None
+            else missing_field_behavior
+        )
+
+        def decode_all() -> typing.Iterator[T]:
+            if not (compiled or lazy):
+                for item in items:
+                    yield record_cls(item, key_behavior, field_behavior)
+                return
+            decoder = _lazy_decode if lazy else _get_decoder(record_cls)
+            missing_value = _missing_field_value(field_behavior)
+            new = record_cls.__new__
+            post_init = getattr(record_cls, "__post_init__", None)
+            if not callable(post_init):
+                post_init = None
+            for item in items:
+                obj = new(record_cls)
+                if keep_source:
+                    setattr(obj, _RECORD_SOURCE, item)
+                decoder(obj, item, key_behavior, missing_value)
+                if post_init is not None:
+                    post_init(obj)
+                yield obj
+
+        if as_list:
+            return list(decode_all())
+        return decode_all()
+
     def __fields__(self):
         return {key: getattr(self, key) for key in dir(self) if not key.startswith("_")}
 
@@ -192,6 +690,9 @@ def record(
             record,
             missing_key_behavior=_missing_key_behavior,
             missing_field_behavior=_missing_field_behavior,
+            compiled=compiled,
+            lazy=lazy,
+            keep_source=keep_source,
             **kwargs,
         )
 
@@ -199,6 +700,20 @@ def record(
     cls.__init__ = __init__
     cls.__repr__ = __repr__
     cls.__fields__ = __fields__
+    cls.from_dicts = from_dicts
+    if lazy:
+        cls.__getattr__ = _lazy_getattr
+        cls.__dir__ = _lazy_dir
+        setattr(
+            cls,
+            _RECORD_LAZY,
+            (_missing_key_behavior, _missing_field_value(_missing_field_behavior)),
+        )
+        if _COMPACT_ATTRIBUTES:
+            names = [_RECORD_RAW, *full_annotations(cls), "__missing_keys__"]
+            if keep_source:
+                names.insert(0, _RECORD_SOURCE)
+            _prime_lazy_layout(cls, names)
     return cls
 
 
@@ -0,0 +1,260 @@
+"""
+План синхронизации: операции над файлами слоев, вычисленные без их выполнения (UnionFS.plan).
+План сериализуется в JSON (или msgpack, если он установлен) и выполняется отдельно (UnionFS.execute),
+выполненные операции помечаются, поэтому прерванный план можно выполнить повторно.
+Ход выполнения сохраняется в журнале (Journal), по нему выполнение продолжается после аварийного завершения
+"""
+import dataclasses
+import json
+import os
+import threading
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+OPERATIONS = ("copy", "rename", "link", "conflict")
+"""
+Виды операций:
+copy - копирование файла из слоя source (внутри слоя, если source == target),
+rename - переименование в слое файла с тем же содержимым,
+link - ссылка на файл с тем же содержимым в слое,
+conflict - версии файла не удалось упорядочить, нужно ручное разрешение
+"""
+
+
+@dataclasses.dataclass
+class Operation:
+    kind: str
+    "Вид операции, см. OPERATIONS"
+    node: str
+    "Имя узла"
+    path: str
+    "Полное имя файла в слое назначения"
+    target: str | None = None
+    "Ключ слоя назначения"
+    source: str | None = None
+    "Ключ слоя источника"
+    source_path: str | None = None
+    "Полное имя файла-источника, если отличается от path (переименование, ссылка, копия внутри слоя)"
+    size: int = 0
+    "Размер файла, байт"
+    version: str = ""
+    "Версия актуального файла на момент планирования: время изменения и хэш, если он известен"
+    seconds: float = 0.0
+    "Оценка продолжительности, с"
+    candidates: list[str] = dataclasses.field(default_factory=list)
+    "Запасные слои-источники копирования, лучший первым"
+    done: bool = False
+
+    @property
+    def transfer(self) -> bool:
+        "Данные передаются между слоями"
+        return self.kind == "copy" and self.source != self.target
+
+    @property
+    def key(self) -> str:
+        """
+        Идентификатор операции в журнале, одинаковый для одной операции разных планов.
+        Включает версию файла: после изменения файла это уже другая операция
+        """
+        return "\t".join(
+            map(
+                str,
+                (
+                    self.node,
+                    self.target,
+                    self.kind,
+                    self.path,
+                    self.source_path,
+                    self.size,
+                    self.version,
+                ),
+            )
+        )
+
+
+@dataclasses.dataclass
+class Plan:
+    operations: list[Operation] = dataclasses.field(default_factory=list)
+    created: float = dataclasses.field(default_factory=time.time)
+    "Время составления плана, секунды от начала эпохи"
+
+    def pending(self) -> list[Operation]:
+        """
+        Невыполненные операции, кроме конфликтов
+        """
+        return [op for op in self.operations if not op.done and op.kind != "conflict"]
+
+    def conflicts(self) -> list[Operation]:
+        return [op for op in self.operations if op.kind == "conflict"]
+
+    def transfer_bytes(self) -> int:
+        """
+        Объем данных, который осталось передать между слоями
+        """
+        return sum(op.size for op in self.pending() if op.transfer)
+
+    def estimated_seconds(self) -> float:
+        return sum(op.seconds for op in self.pending())
+
+    def by_layer(self) -> dict[tuple[str, str], list[Operation]]:
+        """
+        Невыполненные операции, сгруппированные по слою назначения: (имя узла, ключ слоя) - операции
+        """
+        layers: dict[tuple[str, str], list[Operation]] = {}
+        for op in self.pending():
+            layers.setdefault((op.node, op.target), []).append(op)
+        return layers
+
+    def summary(self) -> dict[str, dict[str, int]]:
+        """
+        Вид операции - количество и объем невыполненных операций
+        """
+        result = {kind: {"count": 0, "bytes": 0} for kind in OPERATIONS}
+        for op in self.operations:
+            if not op.done:
+                result[op.kind]["count"] += 1
+                result[op.kind]["bytes"] += op.size
+        return result
+
+    def as_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Plan":
+        return cls(
+            [Operation(**op) for op in data.get("operations", [])],
+            data.get("created", time.time()),
+        )
+
+    def dumps(self, format: str = "json") -> bytes:
+        """
+        Parameters
+        ----------
+        format : "json" или "msgpack"
+        """
+        if format == "msgpack":
+            if msgpack is None:
+                raise ImportError("Для сериализации плана в msgpack нужен пакет msgpack")
+            return msgpack.packb(self.as_dict())
+        return json.dumps(self.as_dict(), ensure_ascii=False).encode()
+
+    @classmethod
+    def loads(cls, data: bytes, format: str = "json") -> "Plan":
+        if format == "msgpack":
+            if msgpack is None:
+                raise ImportError("Для чтения плана из msgpack нужен пакет msgpack")
+            return cls.from_dict(msgpack.unpackb(data))
+        return cls.from_dict(json.loads(data))
+
+    @staticmethod
+    def _format(path: str) -> str:
+        return "msgpack" if str(path).endswith(".msgpack") else "json"
+
+    def save(self, path: str):
+        """
+        Сохранить план, формат по расширению: .msgpack - msgpack, иначе JSON
+        """
+        data = self.dumps(self._format(path))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Plan":
+        with open(path, "rb") as file:
+            return cls.loads(file.read(), cls._format(path))
+
+
+class Journal:
+    """
+    Журнал выполнения плана (контрольные точки): строки JSON о выполненных операциях
+    и о позициях частично переданных файлов. Каждая запись сразу сбрасывается в файл,
+    поэтому журнал переживает аварийное завершение процесса, недописанная строка пропускается
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: set[str] = set()
+        "Ключи выполненных операций"
+        self.offsets: dict[str, tuple[str, int]] = {}
+        "Ключ операции - (ключ слоя-источника, переданных байт)"
+        self.lock = threading.Lock()
+        torn = False
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                text = file.read()
+            torn = bool(text) and not text.endswith("\n")
+            for line in text.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("done"):
+                    self.done.add(entry["op"])
+                    self.offsets.pop(entry["op"], None)
+                else:
+                    self.offsets[entry["op"]] = (entry["source"], entry["offset"])
+        self._file = open(path, "a", encoding="utf-8")
+        if torn:
+            self._file.write("\n")
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, entry: dict):
+        with self.lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def completed(self, op: Operation) -> bool:
+        return op.key in self.done
+
+    def offset(self, op: Operation, source: str) -> int:
+        """
+        Сколько байт файла уже передано из слоя source, 0 - передача из этого слоя не начиналась
+        """
+        found_source, offset = self.offsets.get(op.key, (None, 0))
+        return offset if found_source == source else 0
+
+    def record_offset(self, op: Operation, source: str, offset: int):
+        self.offsets[op.key] = (source, offset)
+        self._write({"op": op.key, "source": source, "offset": offset})
+
+    def record_done(self, op: Operation):
+        self.done.add(op.key)
+        self.offsets.pop(op.key, None)
+        self._write({"op": op.key, "done": True})
+
+    def compact(self):
+        """
+        Забыть выполненные операции, оставив позиции прерванных передач:
+        после сохранения снимков выполненное видно по самим слоям
+        """
+        with self.lock:
+            self.done.clear()
+            self._file.close()
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                for key, (source, offset) in self.offsets.items():
+                    entry = {"op": key, "source": source, "offset": offset}
+                    file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        """
+        Закрыть и удалить журнал: план выполнен
+        """
+        self.close()
+        os.remove(self.path)
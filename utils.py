@@ -1,7 +1,6 @@
-import inspect
+import sys
 import types
 import typing
-from functools import lru_cache
 
 
 def full_annotations(obj) -> dict:
@@ -14,27 +13,49 @@ def full_annotations(obj) -> dict:
     return annot
 
 
-@lru_cache
-def get_origin_type(obj) -> type:
+def get_origin_type(obj, globalns: dict = None, localns: dict = None) -> type:
     """
-    Пытается получить оригинальный тип переданного типа или объекта
+    Пытается получить оригинальный тип переданного типа или объекта.
+    Строковая аннотация (forward reference) вычисляется в пространствах имен globalns и localns,
+    если это не удается - возвращается как есть
     Parameters
     ----------
     obj : Объект или тип для анализа
+    globalns : Глобальное пространство имен, обычно - модуля, где определен класс
+    localns : Локальное пространство имен, обычно - самого класса
 
     Returns
     -------
 
     """
-    # TODO: Доработать для поддержки дженериков
     if type(obj) == str:
-        for stack in inspect.stack():
-            if obj in stack.frame.f_globals:
-                obj = stack.frame.f_globals[obj]
-                break
+        try:
+            obj = eval(obj, globalns or {}, localns)
+        except NameError:
+            ...
     return obj
 
 
+def resolve_annotations(cls: type) -> dict[str, type]:
+    """
+    Аннотации класса со строковыми типами, разрешенными в пространстве имен модуля класса
+    (аналогично typing.get_type_hints, но без обхода MRO и без исключения для неразрешимых имен)
+    Parameters
+    ----------
+    cls : Класс
+
+    Returns
+    -------
+    Словарь имя поля - тип
+    """
+    globalns = getattr(sys.modules.get(cls.__module__), "__dict__", {})
+    localns = dict(vars(cls))
+    return {
+        name: get_origin_type(annotation, globalns, localns)
+        for name, annotation in getattr(cls, "__annotations__", {}).items()
+    }
+
+
 def subdict(origin: dict, keys: str) -> dict:
     """
     Создает словарь из origin, ограниченный переданными ключами
@@ -68,7 +89,7 @@ def to_locals(depth: int = 1, /, **kwargs) -> None:
         return
     if depth < 1:
         raise ValueError("Глубина стека вызова не меньше 1")
-    frame = inspect.stack()[depth].frame
+    frame = sys._getframe(depth)
     frame.f_locals.update(kwargs)
 
 
@@ -92,7 +113,7 @@ def as_exp(**kwargs) -> ...:
     """
     if len(kwargs) == 0:
         raise ValueError("Не передан ни один параметр")
-    frame = inspect.stack()[1].frame
+    frame = sys._getframe(1)
     frame.f_locals.update(kwargs)
     return next(iter(kwargs.values()))
 
@@ -114,8 +135,7 @@ def args_asdict(
     """
     if rename_key_map is None:
         rename_key_map = {}
-    frame = inspect.stack()[1].frame
-    local = dict(frame.f_locals)
+    local = dict(sys._getframe(1).f_locals)
     kwargs = {}
     if local.get(kwargs_name):
         kwargs = local.pop(kwargs_name)